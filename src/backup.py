@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import shutil
+import threading
+
+# ioctl request number for a copy-on-write clone on Linux (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+BACKUP_SUFFIX = "_original"
+JOURNAL_NAME = ".llmii_backup.jsonl"
+
+# Where ExifTool stores the MWG composite tags we write. The journal keeps
+# each of these so a restore gives back every block exactly as it was.
+MWG_BLOCKS = {
+    "MWG:Keywords": ["IPTC:Keywords", "XMP-dc:Subject"],
+    "MWG:Description": ["EXIF:ImageDescription", "IPTC:Caption-Abstract", "XMP-dc:Description"],
+}
+
+
+def reflink(source, destination):
+    """ Make destination a copy-on-write clone of source. It shares all
+        data blocks with the source so it costs no space until one of
+        them is modified. Raises OSError if the filesystem cannot do it.
+    """
+    try:
+        import fcntl
+
+    except ImportError:
+        raise OSError("Reflinks are not supported on this platform")
+
+    with open(source, "rb") as src:
+        with open(destination, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+            except OSError:
+                dst.close()
+                os.remove(destination)
+                raise
+
+    shutil.copystat(source, destination)
+
+
+class BackupManager:
+    """ Keeps a way back to the original metadata of every file we write
+        without paying for a second full copy of it.
+
+        Where the filesystem supports it the file is reflinked to
+        file_original, the same name ExifTool uses, so exiftool
+        -restore_original works too. Elsewhere the original values of
+        the tags we are about to change are appended to a journal in the
+        file's directory, with the MWG composites stored as the tags of
+        each metadata block they are written to.
+    """
+    def __init__(self, mode="auto"):
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.reflink_failed = set()
+        self._journal_cache = (None, {})
+        self.reflinks = 0
+        self.journaled = 0
+
+    def backup(self, file_path, original_tags):
+        """ Back up a file before writing. original_tags is a function
+            that returns the current values of the tags about to be
+            written, only called if they have to be journaled, or None
+            if they could not be read. Returns False if the caller should
+            let ExifTool make its own full copy instead.
+        """
+        if self.mode == "exiftool":
+            return False
+
+        with self.lock:
+            return self._backup(file_path, original_tags)
+
+    def _backup(self, file_path, original_tags):
+        backup_path = file_path + BACKUP_SUFFIX
+
+        # Like ExifTool we never replace the oldest backup
+        if os.path.exists(backup_path):
+            return True
+
+        directory = os.path.dirname(file_path)
+
+        if self.mode in ("auto", "reflink") and directory not in self.reflink_failed:
+            try:
+                reflink(file_path, backup_path)
+                self.reflinks += 1
+
+                return True
+
+            except OSError:
+                # Remember so we only try once per directory
+                self.reflink_failed.add(directory)
+
+        if self.mode in ("auto", "metadata"):
+            if callable(original_tags):
+                original_tags = original_tags()
+
+            if original_tags is not None:
+                self._journal(file_path, original_tags)
+                self.journaled += 1
+
+                return True
+
+        return False
+
+    def _journaled_tags(self, directory):
+        if self._journal_cache[0] != directory:
+            journal = read_journal(directory)
+            self._journal_cache = (directory, {name: set(tags) for name, tags in journal.items()})
+
+        return self._journal_cache[1]
+
+    def _journal(self, file_path, original_tags):
+        """ Append the original values of tags not yet in the journal for
+            this file. The oldest value of each tag is the one restored.
+        """
+        directory, filename = os.path.split(file_path)
+        journaled = self._journaled_tags(directory).setdefault(filename, set())
+        tags = {key: value for key, value in original_tags.items() if key not in journaled}
+
+        if not tags:
+            return
+
+        entry = {"file": filename, "time": time.time(), "tags": tags}
+
+        with open(os.path.join(directory, JOURNAL_NAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        journaled.update(tags)
+
+
+def read_journal(directory):
+    """ Return {filename: tags} from a directory's journal keeping the
+        oldest value of each tag.
+    """
+    entries = {}
+    journal_path = os.path.join(directory, JOURNAL_NAME)
+
+    if not os.path.exists(journal_path):
+        return entries
+
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+
+            except ValueError:
+                continue
+
+            tags = entries.setdefault(entry["file"], {})
+
+            for key, value in entry["tags"].items():
+                tags.setdefault(key, value)
+
+    return entries
+
+def restore_directory(directory, et, callback=print):
+    """ Put back the original files and metadata in one directory. A
+        file that cannot be restored does not stop the others, and its
+        journal entry is kept so the restore can be run again.
+        Returns the number of files restored and the paths that failed.
+    """
+    restored = set()
+    failed = []
+
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(BACKUP_SUFFIX):
+            original = entry.path[:-len(BACKUP_SUFFIX)]
+
+            if not os.path.exists(original):
+                continue
+
+            try:
+                os.replace(entry.path, original)
+                restored.add(os.path.basename(original))
+
+            except OSError as e:
+                callback(f"Error restoring {original}: {str(e)}")
+                failed.append(original)
+
+    journal = read_journal(directory)
+    remaining = {}
+
+    for filename, tags in journal.items():
+        file_path = os.path.join(directory, filename)
+
+        if filename in restored or not os.path.exists(file_path):
+            continue
+
+        # Journals from before the blocks were kept hold the composites.
+        # Where a block was recorded it is the exact value to put back.
+        tags = dict(tags)
+
+        for composite, blocks in MWG_BLOCKS.items():
+            if any(block in tags for block in blocks):
+                tags.pop(composite, None)
+
+        # An empty value tells ExifTool to delete a tag that was not there before
+        values = {key: ("" if value is None else value) for key, value in tags.items()}
+
+        try:
+            et.set_tags(file_path, tags=values, params=["-P", "-overwrite_original"])
+            restored.add(filename)
+
+        except Exception as e:
+            callback(f"Error restoring {file_path}: {str(e)}")
+            failed.append(file_path)
+            remaining[filename] = tags
+
+    journal_path = os.path.join(directory, JOURNAL_NAME)
+
+    if remaining:
+        with open(journal_path, "w", encoding="utf-8") as f:
+            for filename, tags in remaining.items():
+                f.write(json.dumps({"file": filename, "time": time.time(), "tags": tags}, ensure_ascii=False) + "\n")
+
+    elif journal:
+        os.remove(journal_path)
+
+    if failed:
+        callback(f"Could not restore {len(failed)} files in {directory}: {', '.join(failed)}")
+
+    return len(restored), failed
+
+def restore_backups(root_dir, et, no_crawl=False, callback=print):
+    """ Restore every backup under root_dir made by BackupManager or by
+        ExifTool itself.
+    """
+    total = 0
+    failures = []
+    directories = [root_dir] if no_crawl else (root for root, _, _ in os.walk(root_dir))
+
+    for directory in directories:
+        count, failed = restore_directory(directory, et, callback)
+
+        if count:
+            callback(f"Restored {count} files in {directory}")
+
+        total += count
+        failures.extend(failed)
+
+    if failures:
+        callback(f"Restore finished with errors. {total} files restored, {len(failures)} could not be restored:")
+
+        for file_path in failures:
+            callback(f"  {file_path}")
+
+    else:
+        callback(f"Restore complete. {total} files restored.")
+
+    return total
@@ -0,0 +1,130 @@
+import os
+import json
+import math
+import tempfile
+import threading
+from .config import RESOURCES_DIR
+
+BUDGET_PATH = os.path.join(RESOURCES_DIR, "token_budgets.json")
+BUDGET_VERSION = 1
+
+
+class TokenBudget:
+    """ Learns how many tokens each model needs for each task and picks
+        max_tokens from that instead of a fixed GenTokens.
+
+        The completion tokens of the last window answers are kept per
+        model and task. The budget is the given percentile of them times
+        margin, kept between minimum and maximum. An answer cut off by
+        the limit needed more than it got, so it counts as half again
+        what it used, which raises the budget until answers fit. Until
+        min_samples answers have been seen the fixed budget is used.
+
+        What was learned is saved in the resources directory so the next
+        run starts from it.
+    """
+    def __init__(self, minimum=64, maximum=1024, percentile=0.95, margin=1.2, window=200,
+                 min_samples=8, path=BUDGET_PATH):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.percentile = percentile
+        self.margin = margin
+        self.window = window
+        self.min_samples = min_samples
+        self.path = path
+        self.lock = threading.Lock()
+
+        # model -> task -> tokens needed, oldest first
+        self.samples = {}
+
+        # (model, task) -> budget last handed out
+        self.chosen = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if data.get("version") == BUDGET_VERSION:
+                self.samples = data.get("models", {})
+
+        except (OSError, ValueError):
+            self.samples = {}
+
+    def save(self):
+        """ Write what was learned atomically if anything changed.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+
+            data = json.dumps({"version": BUDGET_VERSION, "models": self.samples})
+            self.changed = False
+
+        directory = os.path.dirname(self.path)
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=".llmii-", suffix=".json", dir=directory)
+
+        except OSError as e:
+            print(f"Could not save token budgets: {str(e)}")
+
+            return
+
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+
+            os.replace(temp_path, self.path)
+
+        except OSError as e:
+            print(f"Could not save token budgets: {str(e)}")
+
+            try:
+                os.remove(temp_path)
+
+            except OSError:
+                pass
+
+    def observe(self, model, task, tokens, truncated=False):
+        """ Record the completion tokens an answer took. truncated means
+            it was still cut off by the limit.
+        """
+        if not tokens:
+            return
+
+        needed = math.ceil(tokens * 1.5) if truncated else tokens
+
+        with self.lock:
+            samples = self.samples.setdefault(model or "unknown", {}).setdefault(task, [])
+            samples.append(needed)
+            del samples[:-self.window]
+            self.changed = True
+
+    def budget(self, model, task, default):
+        """ max_tokens for the next answer, or default while too little
+            is known.
+        """
+        with self.lock:
+            samples = self.samples.get(model or "unknown", {}).get(task, [])
+
+            if len(samples) < self.min_samples:
+                chosen = int(default)
+
+            else:
+                ordered = sorted(samples)
+                needed = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+                chosen = min(self.maximum, max(self.minimum, math.ceil(needed * self.margin)))
+
+            self.chosen[(model or "unknown", task)] = chosen
+
+        return chosen
+
+    def current(self):
+        """ The last budget chosen for each task of each model.
+        """
+        with self.lock:
+            return {f"{model} {task}": chosen for (model, task), chosen in self.chosen.items()}
@@ -0,0 +1,274 @@
+import os
+import hashlib
+import threading
+import collections
+
+PARTIAL_BYTES = 64 * 1024
+
+
+def _hash_file(file_path, partial=False):
+    """ blake2b of the whole file, or of its first and last
+        PARTIAL_BYTES if partial is set.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+
+    with open(file_path, "rb") as f:
+        if partial:
+            digest.update(f.read(PARTIAL_BYTES))
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+
+            if size > PARTIAL_BYTES:
+                f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+                digest.update(f.read(PARTIAL_BYTES))
+
+        else:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+class DuplicateFinder:
+    """ Recognizes copies of files that were already processed so the
+        result of one decode and inference can be written to every copy.
+
+        Hardlinks are found by device and inode. Other copies are found
+        by size, then a hash of the start and end of the file, then a
+        hash of the whole file, so most files are never read in full.
+
+        The hashes of a processed file are taken before its metadata is
+        written, since writing changes its bytes. Only files the crawl
+        found with the same size can be copies, so a file is hashed in
+        part only if such a file exists and in full only if one of them
+        also has the same partial hash. Records are kept only while files
+        of that size are still to come, and at most max_records hardlinks
+        are remembered.
+
+        Each copy keeps its own Identifier; only the generated keywords,
+        caption and status are shared, and only if the copy had the same
+        existing keywords and caption so the result is what processing it
+        would have given.
+    """
+    def __init__(self, max_records=100000):
+        self.max_records = max_records
+        self.lock = threading.Lock()
+        self.by_inode = collections.OrderedDict()
+        self.by_size = {}
+        self.groups = {}
+
+        # size -> paths found but not processed yet, path -> size and inode
+        self.queued = {}
+        self.sizes = {}
+        self.inodes = {}
+
+        # Partial hashes of queued files, which have not been written yet
+        self.partials = {}
+
+    def _stat(self, file_path):
+        try:
+            stat = os.stat(file_path)
+
+        except OSError:
+            return None
+
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_nlink
+
+    def found(self, paths):
+        """ Note files that will be processed so copies of them are
+            hashed when their first copy is.
+        """
+        for file_path in paths:
+            stat = self._stat(file_path)
+
+            if stat is None:
+                continue
+
+            with self.lock:
+                self.queued.setdefault(stat[2], set()).add(file_path)
+                self.sizes[file_path] = stat[2]
+                self.inodes[file_path] = stat[:2]
+
+    def done(self, paths):
+        """ Forget files that were processed or passed over. Records of
+            a size nothing else will match are dropped.
+        """
+        with self.lock:
+            for file_path in paths:
+                size = self.sizes.pop(file_path, None)
+                self.inodes.pop(file_path, None)
+                self.partials.pop(file_path, None)
+
+                if size is None:
+                    continue
+
+                queued = self.queued.get(size)
+                queued.discard(file_path)
+
+                if not queued:
+                    del self.queued[size]
+                    self.by_size.pop(size, None)
+
+    def _partial(self, file_path):
+        """ The partial hash of a file not written yet. The file is read
+            without the lock held and only the result is stored under it.
+        """
+        with self.lock:
+            partial = self.partials.get(file_path)
+
+        if partial is None:
+            partial = _hash_file(file_path, partial=True)
+
+            with self.lock:
+                if file_path in self.sizes:
+                    self.partials[file_path] = partial
+
+        return partial
+
+    def fingerprint(self, file_path):
+        """ Record the identity of a file before it is written. Returns
+            a record to pass to remember, or None.
+        """
+        stat = self._stat(file_path)
+
+        if stat is None:
+            return None
+
+        size = stat[2]
+        partial = full = None
+
+        with self.lock:
+            peers = [record["partial"] for record in self.by_size.get(size, [])]
+
+            # Hardlinks of this file are found by inode instead
+            queued = [
+                path for path in self.queued.get(size, ())
+                if self.inodes.get(path) != stat[:2]
+            ]
+
+        if peers or queued:
+            try:
+                partial = self._partial(file_path)
+
+            except OSError:
+                return None
+
+            for path in queued:
+                if partial in peers:
+                    break
+
+                try:
+                    peers.append(self._partial(path))
+
+                except OSError:
+                    continue
+
+            if partial in peers:
+                try:
+                    full = _hash_file(file_path)
+
+                except OSError:
+                    return None
+
+        return {
+            "path": file_path,
+            "inode": stat[:2],
+            "links": stat[3],
+            "size": size,
+            "partial": partial,
+            "full": full,
+        }
+
+    def remember(self, record, existing, result):
+        """ Store the generated result for a fingerprinted file.
+        """
+        if record is None:
+            return
+
+        record["existing"] = self._comparable(existing)
+        record["result"] = {
+            key: result.get(key) for key in ("MWG:Keywords", "MWG:Description", "XMP:Status")
+        }
+
+        # Captions in other languages from --languages
+        for key, value in result.items():
+            if key.startswith("XMP:Description-"):
+                record["result"][key] = value
+
+        with self.lock:
+            if record["links"] > 1:
+                self.by_inode[record["inode"]] = record
+
+                while len(self.by_inode) > self.max_records:
+                    self.by_inode.popitem(last=False)
+
+            # Without a full hash no file found had the same start and end
+            if record["full"] is not None and record["size"] in self.queued:
+                self.by_size.setdefault(record["size"], []).append(record)
+
+    def _comparable(self, metadata):
+        keywords = metadata.get("MWG:Keywords") or []
+
+        if not isinstance(keywords, list):
+            keywords = [keywords]
+
+        return sorted(str(keyword) for keyword in keywords), metadata.get("MWG:Description")
+
+    def find(self, file_path, existing):
+        """ Return the result of an earlier copy of this file, or None.
+        """
+        stat = self._stat(file_path)
+
+        if stat is None:
+            return None
+
+        with self.lock:
+            match = self.by_inode.get(stat[:2])
+            candidates = list(self.by_size.get(stat[2], []))
+
+        if match is None:
+            if not candidates:
+                return None
+
+            try:
+                partial = self._partial(file_path)
+                candidates = [record for record in candidates if record["partial"] == partial]
+
+                # A record without a full hash had no copy when it was taken
+                candidates = [record for record in candidates if record["full"] is not None]
+
+                if candidates:
+                    full = _hash_file(file_path)
+                    candidates = [record for record in candidates if record["full"] == full]
+
+            except OSError:
+                return None
+
+            if not candidates:
+                return None
+
+            match = candidates[0]
+
+        if match["existing"] != self._comparable(existing):
+            return None
+
+        with self.lock:
+            self.groups.setdefault(match["path"], []).append(file_path)
+
+        return dict(match["result"])
+
+    def report(self, callback, limit=20):
+        """ List the duplicate groups that shared a result.
+        """
+        if not self.groups:
+            return
+
+        copies = sum(len(paths) for paths in self.groups.values())
+        callback(f"Reused results for {copies} duplicate copies in {len(self.groups)} groups")
+
+        for count, (original, paths) in enumerate(self.groups.items()):
+            if count == limit:
+                callback(f"... and {len(self.groups) - limit} more groups")
+                break
+
+            callback(f"{original}: {', '.join(paths)}")
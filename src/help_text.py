@@ -20,7 +20,8 @@ SETTINGS_HELP = """
 <p><b>No caption query:</b> Skip caption generation entirely, only create keywords. This option is a bit misleading because it will always generate a caption anyway, but this option will not write it to the metadata. Use this if you have captions you don't want to overwrite, but it won't make processing faster.</p>
 
 <h3>Generation Options</h3>
-<p><b>GenTokens:</b> Maximum number of tokens to generate in response. These are tokens, not words. Fewer tokens means faster processing per generation but may lead to more retries because the model may get cut off mid generation. More is not necessarily better though. Optimal range is between 150 and 300.</p>
+<p><b>GenTokens:</b> Maximum number of tokens to generate in response. These are tokens, not words. Fewer tokens means faster processing per generation but may lead to more retries because the model may get cut off mid generation. More is not necessarily better though. Optimal range is between 150 and 300. An answer that gets cut off is first continued where it stopped, which is much cheaper than asking again (--continuations on the command line sets how many times).</p>
+<p><b>Learn from the model:</b> Instead of always allowing GenTokens, keep track of how many tokens the model actually uses for each task and allow a little more than nearly all of its answers needed. Answers that got cut off raise the limit. GenTokens is used until enough answers have been seen, and what was learned is kept for the next run. On the command line this is --adaptive-tokens, with --min-gen-count and --max-gen-count as the bounds.</p>
 
 <h3>Image Options</h3>
 <p><b>Dimension length:</b> The maximum length of a horizontal or vertical dimension of the image, in pixels. Setting this higher will not necessarily result in better generations. Larger image sizes can take more memory and can lead to much slower processing. It is recommended to keep this between 392 and 896.<p> 
@@ -30,7 +31,7 @@ SETTINGS_HELP = """
 <p><b>Reprocess everything:</b> Process all images, even if they already have metadata. This will treat every image file as if it were brand new and the tool has never seen it before.</p>
 <p><b>Reprocess failures:</b> Only reprocess images that failed in previous runs. Good idea to run with this option after a successful run to clean up stragglers.</p>
 <p><b>Fix any orphans:</b> When a file gets processed it gets some metadata added to it so that the tool knows it has been processed and what the state of the last processing was. If we find images with what looks like valid metadata that was processed by the tool, but the status markers are missing, we call these orphans. This option will add the status marker to the orphans without regenerating the metadata. Without this checked then files which were produced with versions of the tool before the removal of the need for the json database will be processed again as new files. With this checked then if there is bad metadata in images that looks valid to the tool, it will mark those files as a success. It is recommended to use this option only if you have used previous versions of this tool before March 2025 and are running on those files again.</p>
-<p><b>No backups:</b> Don't create backups of existing metadata before modifying. Exiftool will create a file with an _original label at the end as a backup for every one it alters. If you don't want one of those for every image processed by the tool, check this box.</p>
+<p><b>No backups:</b> Don't create backups of existing metadata before modifying. On filesystems that support copy-on-write clones (btrfs, XFS) a file with an _original label at the end is created which takes no extra space until the image is changed. Elsewhere the original keywords, caption and status are saved to a small .llmii_backup.jsonl file in each folder instead of copying the whole image. Run llmii with --restore on the folder to put the originals back. If you don't want any backups, check this box.</p>
 <p><b>Pretend mode:</b> Simulate processing without making any changes. This allows you to see what metadata would be generated without writing to any files.</p>
 <p><b>No file validation:</b> Skip verifying file content. If you are seeing a lot of valid files being skipped as invalid, check this. Otherwise leave it alone.</p>
 <p><b>No retries:</b> Don't retry failed API requests. This is when you don't want to bother trying a second time if you get a parse error from the AI. It is recommended to leave this disabled.</p>
@@ -49,6 +50,8 @@ SETTINGS_HELP = """
 <p><b>Cannot start with 3+ digits:</b> Filter out keywords starting with 3+ digits. '3d video' would be fine but '2024 summer' would be rejected.</p>
 <p><b>Words must be 2+ characters:</b> Require words to be at least 2 characters long unless they are 'x' or 'u'.</p>
 <p><b>Only Latin characters:</b> Remove keywords with non-Latin characters.</p>
+<p><b>Keyword language:</b> The language the model writes keywords in. Its plural rules are used by Depluralize keywords and its 'and'/'or' words by the split option. With Only Latin characters, English keeps plain ASCII letters while French, German and Spanish keep accented letters.</p>
+<p><b>Caption and keywords in:</b> A comma separated list of language codes (en, fr, de, es). One request asks the model for a caption and keywords in each of them. The keywords of all languages are written, each corrected with the rules for its language. The first language's caption is the main caption and every caption is also stored as a language alternative of the description. The generation limit is multiplied by the number of languages.</p>
 """
 
 def get_settings_help():
@@ -0,0 +1,273 @@
+import os
+import re
+import threading
+
+IGNORE_FILE = ".llmiiignore"
+
+
+def _translate(pattern):
+    """ Translate the glob part of a gitignore pattern into a regex
+        matching a path relative to the pattern's base directory.
+    """
+    i = 0
+    parts = []
+
+    while i < len(pattern):
+        char = pattern[i]
+
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+
+            continue
+
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+
+            continue
+
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+
+            continue
+
+        if char == "*":
+            parts.append("[^/]*")
+
+        elif char == "?":
+            parts.append("[^/]")
+
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+
+            if end == -1:
+                parts.append(re.escape(char))
+
+            else:
+                body = pattern[i + 1:end]
+
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+
+        else:
+            parts.append(re.escape(char))
+
+        i += 1
+
+    return "".join(parts)
+
+def compile_rule(line):
+    """ Compile one gitignore style line into (regex, negate, dir_only,
+        anchored), or None for blank lines and comments.
+    """
+    line = line.rstrip("\n\r")
+
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+
+    if not line or line.startswith("#"):
+        return None
+
+    negate = line.startswith("!")
+
+    if negate:
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+
+    # A slash anywhere but the end anchors the pattern to its base
+    anchored = "/" in line
+    line = line.lstrip("/")
+
+    if not line:
+        return None
+
+    prefix = "^" if anchored else "^(?:.*/)?"
+
+    return re.compile(prefix + _translate(line) + "$"), negate, dir_only, anchored
+
+
+class RuleSet:
+    """ The rules from one source and the directory they are relative to.
+    """
+    def __init__(self, base, lines):
+        self.base = os.path.normpath(base) if base else None
+        self.rules = [rule for rule in (compile_rule(line) for line in lines) if rule]
+
+    def relative(self, path):
+        """ path relative to base with / separators, or None if it is
+            not below base.
+        """
+        if self.base is None:
+            return None
+
+        prefix = self.base.rstrip(os.sep) + os.sep
+
+        if not path.startswith(prefix):
+            return None
+
+        relative = path[len(prefix):]
+
+        return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+
+class IgnoreRules:
+    """ Decides which files and directories the crawl leaves alone.
+
+        Rules come from --exclude and --include on the command line, which
+        apply under every root, and from .llmiiignore files, which apply to
+        the directory they are in and everything below it. Both use
+        gitignore syntax: the last matching rule wins, ! and --include
+        re-include, a trailing / matches directories only and a pattern
+        with a / in it is relative to where it was given.
+
+        Excluded directories are pruned, so nothing below them is listed.
+        Each ignore file is read and compiled once per run.
+    """
+    def __init__(self, root_dirs, excludes=None, includes=None):
+        self.root_dirs = [os.path.normpath(root_dir) for root_dir in root_dirs]
+        lines = list(excludes or []) + ["!" + pattern for pattern in includes or []]
+        self.command_line = [RuleSet(root_dir, lines) for root_dir in self.root_dirs] if lines else []
+        self.command_line_lines = lines
+        self.lock = threading.Lock()
+
+        # directory -> tuple of RuleSets from ignore files, root first
+        self.chains = {}
+        self.files_ignored = 0
+        self.directories_pruned = 0
+
+    def signature(self):
+        """ A string that changes when the command line rules do.
+        """
+        return "\n".join(self.command_line_lines)
+
+    def _root_of(self, directory):
+        for root_dir in self.root_dirs:
+            if directory == root_dir or directory.startswith(root_dir.rstrip(os.sep) + os.sep):
+                return root_dir
+
+        return None
+
+    def _read_ignore_file(self, directory):
+        try:
+            with open(os.path.join(directory, IGNORE_FILE), "r", encoding="utf-8") as f:
+                rule_set = RuleSet(directory, f.readlines())
+
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        return rule_set if rule_set.rules else None
+
+    def chain(self, directory):
+        """ The RuleSets from ignore files that apply inside directory.
+        """
+        directory = os.path.normpath(directory)
+
+        with self.lock:
+            chain = self.chains.get(directory)
+
+        if chain is not None:
+            return chain
+
+        root_dir = self._root_of(directory)
+        parent = os.path.dirname(directory)
+
+        if root_dir is None or directory == root_dir or parent == directory:
+            chain = ()
+
+        else:
+            chain = self.chain(parent)
+
+        own = self._read_ignore_file(directory)
+
+        if own:
+            chain = chain + (own,)
+
+        with self.lock:
+            self.chains[directory] = chain
+
+        return chain
+
+    def _match(self, rule_sets, path, is_dir):
+        ignored = False
+        name = os.path.basename(path)
+
+        for rule_set in rule_sets:
+            relative = rule_set.relative(path)
+
+            for regex, negate, dir_only, anchored in rule_set.rules:
+                if dir_only and not is_dir:
+                    continue
+
+                if relative is None:
+                    # Outside the base only a bare name can match
+                    if anchored or not regex.match(name):
+                        continue
+
+                elif not regex.match(relative):
+                    continue
+
+                ignored = not negate
+
+        return ignored
+
+    def rules_for(self, directory):
+        """ Every RuleSet that applies to entries of directory, in the
+            order they are checked. Look this up once per directory.
+        """
+        return self.chain(directory) + tuple(self.command_line)
+
+    def excluded(self, rule_sets, path, is_dir=False):
+        """ True if an entry of a directory is excluded by rule_sets from
+            rules_for. Counts what it excludes.
+        """
+        if not rule_sets or not self._match(rule_sets, path, is_dir):
+            return False
+
+        with self.lock:
+            if is_dir:
+                self.directories_pruned += 1
+
+            else:
+                self.files_ignored += 1
+
+        return True
+
+    def ignored_path(self, path, count=True):
+        """ True if a path that did not come from the walk is excluded,
+            checking every directory between its root and the path too.
+        """
+        path = os.path.normpath(path)
+        root_dir = self._root_of(path)
+        ancestors = []
+
+        if root_dir is not None:
+            directory = os.path.dirname(path)
+
+            while directory != root_dir and directory.startswith(root_dir):
+                ancestors.append(directory)
+                directory = os.path.dirname(directory)
+
+        for ancestor in reversed(ancestors):
+            if self._match(self.rules_for(os.path.dirname(ancestor)), ancestor, True):
+                break
+
+        else:
+            if not self._match(self.rules_for(os.path.dirname(path)), path, False):
+                return False
+
+        if count:
+            with self.lock:
+                self.files_ignored += 1
+
+        return True
@@ -58,17 +58,15 @@ class ImageProcessor:
                 ".rwl",  # Leica
             ],
         }
+        self.extension_map = {
+            ext: file_type for file_type, extensions in self.image_extensions.items() for ext in extensions
+        }
+        
     def _get_image_type(self, file_path):
         """ Return the image type based on extension
         """
-        file_ext = os.path.splitext(file_path)[1]
-        if not file_ext.startswith("."):
-            file_ext = "." + file_ext
-        file_ext = file_ext.lower()
-        for file_type, extensions in self.image_extensions.items():
-            if file_ext in [ext.lower() for ext in extensions]:
-                return file_type
-        return None
+        file_ext = os.path.splitext(file_path)[1].lower()
+        return self.extension_map.get(file_ext)
     
     def _calculate_dimensions(self, width, height):
         """ Calculate dimensions maintaining aspect ratio and patch compatibility 
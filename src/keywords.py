@@ -0,0 +1,322 @@
+import re
+import functools
+import unicodedata
+from .languages import get_language
+
+# The config fields that change what normalize_keyword returns
+NORMALIZE_SETTINGS = [
+    "normalize_keywords",
+    "depluralize_keywords",
+    "limit_word_count",
+    "max_words_per_keyword",
+    "split_and_entries",
+    "ban_prompt_words",
+    "no_digits_start",
+    "min_word_length",
+    "latin_only",
+    "keyword_language",
+]
+
+NOT_WORD_SPACE_HYPHEN = re.compile(r'[^\w\s-]')
+SPACES = re.compile(r'\s+')
+HYPHENS = re.compile(r'-+')
+HYPHENATED = re.compile(r'^[\w]+-[\w]+$')
+DIGITS_START = re.compile(r'^\d{3,}')
+
+
+class DefaultConfig:
+    def __init__(self):
+        self.normalize_keywords = True
+        self.depluralize_keywords = True
+        self.limit_word_count = True
+        self.max_words_per_keyword = 2
+        self.split_and_entries = True
+        self.ban_prompt_words = True
+        self.no_digits_start = True
+        self.min_word_length = True
+        self.latin_only = True
+        self.keyword_language = "en"
+
+DEFAULT_CONFIG = DefaultConfig()
+
+def _setting(config, name):
+    # Configs made before a setting existed get its default
+    return getattr(config, name, getattr(DEFAULT_CONFIG, name))
+
+
+def split_on_internal_capital(word):
+    """ Split a word if it contains a capital letter after the 4th position.
+        Returns the original word if no split is needed, or the split
+        version if a capital is found.
+
+        Examples:
+            BlueSky -> Blue Sky
+            microService -> micro Service
+    """
+    if len(word) <= 4:
+        return word
+
+    for i in range(4, len(word)):
+        if word[i].isupper():
+            return word[:i] + " " + word[i:]
+
+    return word
+
+
+class KeywordNormalizer:
+    """ normalize_keyword for one set of settings and banned words.
+
+        The settings are read once, the patterns are compiled once and
+        results are kept in a bounded LRU memo, since the same keywords
+        come back from the model over and over. The word rules come from
+        the Language for keyword_language, so each language has its own
+        normalizer and memo.
+    """
+    def __init__(self, banned_words, config, cache_size=65536, language=None):
+        self.banned_words = frozenset(banned_words)
+
+        for name in NORMALIZE_SETTINGS:
+            setattr(self, name, _setting(config, name))
+
+        if language:
+            self.keyword_language = language
+
+        self.language = get_language(self.keyword_language)
+
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+        # Every distinct result seen this run, so equal keywords from
+        # different images share one string
+        self.vocabulary = {}
+
+    def __call__(self, keyword):
+        if not self.normalize_keywords:
+            return keyword.strip()
+
+        if not isinstance(keyword, str):
+            keyword = str(keyword)
+
+        return self.normalize(keyword)
+
+    def normalize_all(self, keywords):
+        """ Normalize many keywords, dropping empty results and repeats.
+            Each distinct input is only normalized once and the results
+            keep the order they were first seen in.
+        """
+        seen_inputs = set()
+        seen_results = set()
+        results = []
+
+        for keyword in keywords:
+            if isinstance(keyword, str):
+                if keyword in seen_inputs:
+                    continue
+
+                seen_inputs.add(keyword)
+
+            normalized = self(keyword)
+
+            if not normalized or normalized in seen_results:
+                continue
+
+            normalized = self.vocabulary.setdefault(normalized, normalized)
+            seen_results.add(normalized)
+            results.append(normalized)
+
+        return results
+
+    def _normalize(self, keyword):
+        language = self.language
+
+        if language.compose and not keyword.isascii():
+            keyword = unicodedata.normalize("NFC", keyword)
+
+        # Handle internal capitalization before lowercase conversion
+        split_words = []
+
+        for word in keyword.strip().split():
+            split_words.extend(split_on_internal_capital(word).split())
+
+        keyword = " ".join(split_words).lower().strip()
+
+        if language.elision:
+            keyword = language.elision.sub('', keyword)
+
+        if self.latin_only:
+            keyword = language.latin.sub('', keyword)
+
+        keyword = NOT_WORD_SPACE_HYPHEN.sub('', keyword)
+        keyword = SPACES.sub(' ', keyword)
+        keyword = HYPHENS.sub('-', keyword)
+        keyword = keyword.replace('_', ' ')
+
+        tokens = keyword.split()
+        words = []
+
+        for token in tokens:
+            if '-' in token:
+                if not HYPHENATED.match(token):
+                    return None
+
+                words.extend(token.split('-'))
+
+            else:
+                words.append(token)
+
+        # Nothing left, e.g. a keyword written only in another script
+        if not words:
+            return ''
+
+        if self.limit_word_count and len(words) > self.max_words_per_keyword + 1:
+            return None
+
+        if self.split_and_entries and len(words) == 3 and words[1] in language.and_or:
+            if ' '.join(words) not in language.and_exceptions:
+                if self.depluralize_keywords:
+                    tokens = [language.depluralize(words[0]), language.depluralize(words[2])]
+
+                else:
+                    tokens = [words[0], words[2]]
+
+        for word in words:
+            if self.min_word_length and len(word) < 2 and word not in language.short_words:
+                return None
+
+            if self.ban_prompt_words and word in self.banned_words:
+                return None
+
+        if self.no_digits_start and DIGITS_START.match(words[0]):
+            return None
+
+        if self.depluralize_keywords:
+            if len(words) == 1:
+                tokens = [language.depluralize(words[0])]
+
+            elif language.every_word:
+                tokens = [language.depluralize(token) for token in tokens]
+
+            elif len(tokens) > 1:
+                tokens[-1] = language.depluralize(tokens[-1])
+
+        return ' '.join(tokens)
+
+
+_normalizers = {}
+
+def get_normalizer(banned_words, config=None, language=None):
+    """ Return the shared KeywordNormalizer for these settings so its
+        memo lasts for the whole run. language overrides the config's
+        keyword_language.
+    """
+    if config is None:
+        config = DEFAULT_CONFIG
+
+    settings = {name: _setting(config, name) for name in NORMALIZE_SETTINGS}
+
+    if language:
+        settings["keyword_language"] = language
+
+    key = tuple(settings.values()) + (tuple(banned_words),)
+    normalizer = _normalizers.get(key)
+
+    if normalizer is None:
+        normalizer = _normalizers[key] = KeywordNormalizer(banned_words, config, language=language)
+
+    return normalizer
+
+def normalize_keyword(keyword, banned_words, config=None):
+    """ Normalizes keywords according to specific rules:
+        - Splits unhyphenated compound words on internal capitals
+        - Max words determined by config (default 2) unless middle word is 'and'/'or' (then +1)
+        - If split_and_entries enabled, remove and/or unless in exceptions list
+        - Hyphens between alphanumeric chars count as two words
+        - Cannot start with 3+ digits if no_digits_start is enabled
+        - Each word must be 2+ chars if min_word_length enabled (unless it is x or u)
+        - Removes all non-alphanumeric except spaces and valid hyphens
+        - Checks against banned words if ban_prompt_words enabled
+        - Makes singular if depluralize_keywords enabled
+        - Returns lowercase result
+
+        The and/or words, plural rules and what latin_only keeps come
+        from config.keyword_language (English by default).
+    """
+    return get_normalizer(banned_words, config)(keyword)
+
+def normalize_keywords(keywords, banned_words, config=None, language=None):
+    """ Normalize an iterable of keywords with the same rules as
+        normalize_keyword. Returns the distinct non-empty results in
+        the order they first appear, so the same input always gives
+        the same list. language overrides config.keyword_language.
+    """
+    return get_normalizer(banned_words, config, language).normalize_all(keywords)
+
+def normalize_mixed_keywords(keywords, banned_words, config=None, languages=()):
+    """ Normalize keywords that can be in any of several languages, like
+        the ones already on a file written with --languages. The first
+        language is the file's caption language and is tried first.
+
+        Each keyword goes through the rules of one language: the first
+        that knows the word, as a singular, an irregular plural or an
+        elided article like the l' in l'arbre, otherwise the first that
+        makes it a singular its rules then leave as it is. A keyword no
+        language recognizes takes the result of the first language that
+        keeps all of its characters, so French keywords are not stripped
+        of accents by the English rules. One that every language rejects
+        is dropped.
+
+        With fewer than two languages this is normalize_keywords.
+    """
+    languages = list(dict.fromkeys(languages))
+
+    if len(languages) < 2:
+        return normalize_keywords(keywords, banned_words, config, languages[0] if languages else None)
+
+    # The same rules without depluralizing tell what depluralizing changed
+    plain_config = DefaultConfig()
+    plain_config.__dict__.update({name: _setting(config or DEFAULT_CONFIG, name) for name in NORMALIZE_SETTINGS})
+    plain_config.depluralize_keywords = False
+
+    normalizers = [get_normalizer(banned_words, config, code) for code in languages]
+    plain_normalizers = [get_normalizer(banned_words, plain_config, code) for code in languages]
+    results = []
+
+    for keyword in keywords:
+        if not isinstance(keyword, str):
+            keyword = str(keyword)
+
+        stripped = keyword.strip()
+        candidates = [normalizer(keyword) for normalizer in normalizers]
+
+        if not any(candidates):
+            continue
+
+        usable = [
+            (normalizer, plain_normalizer(keyword), candidate)
+            for normalizer, plain_normalizer, candidate in zip(normalizers, plain_normalizers, candidates)
+            if candidate and not (normalizer.latin_only and normalizer.language.latin.search(stripped))
+        ]
+        chosen = None
+
+        for normalizer, plain, candidate in usable:
+            language = normalizer.language
+
+            if plain.split()[-1:] and plain.split()[-1] in language.known_words or (
+                language.elision and language.elision.search(stripped.lower())
+            ):
+                chosen = candidate
+
+                break
+
+        if chosen is None:
+            for normalizer, plain, candidate in usable:
+                if candidate != plain and normalizer(candidate) == candidate:
+                    chosen = candidate
+
+                    break
+
+        if chosen is None:
+            chosen = usable[0][2] if usable else stripped
+
+        results.append(chosen)
+
+    return list(dict.fromkeys(result for result in results if result))
@@ -0,0 +1,279 @@
+import re
+import functools
+from .llmii_utils import de_pluralize, AND_EXCEPTIONS, singular_irregular, singular_uninflected, singular_uncountable
+
+# Anything that is not ASCII, which is what latin_only has always kept
+# for English
+NOT_ASCII = re.compile(r'[^\x00-\x7F]')
+
+# Anything outside the Latin script, so accented letters, ß and ligatures
+# survive latin_only while Cyrillic, CJK and emoji are still removed
+NOT_LATIN_SCRIPT = re.compile(
+    r'[^\u0000-\u02AF\u0300-\u036F\u1E00-\u1EFF\u2C60-\u2C7F\uA720-\uA7FF\uAB30-\uAB6F\uFB00-\uFB06]'
+)
+
+
+class SuffixRules:
+    """ Depluralizes by ordered suffix rules.
+
+        Each rule is (suffix, replacement, stem) where stem is an optional
+        regex the rest of the word has to match. Rules are indexed by
+        suffix and tried longest suffix first, so a word is only checked
+        against the few rules that could apply to it.
+    """
+    def __init__(self, rules, irregular=None, invariant=(), min_length=4):
+        self.irregular = dict(irregular or {})
+        self.invariant = frozenset(invariant)
+        self.min_length = min_length
+        self.by_suffix = {}
+
+        for suffix, replacement, stem in rules:
+            self.by_suffix.setdefault(suffix, []).append(
+                (replacement, re.compile(stem) if stem else None)
+            )
+
+        self.lengths = sorted({len(suffix) for suffix in self.by_suffix}, reverse=True)
+
+        # Words the rules know for sure: irregular plurals and singulars
+        self.known_words = self.invariant | set(self.irregular) | set(self.irregular.values())
+
+    def __call__(self, word):
+        if word in self.irregular:
+            return self.irregular[word]
+
+        if len(word) < self.min_length or word in self.invariant:
+            return word
+
+        for length in self.lengths:
+            if length >= len(word):
+                continue
+
+            rules = self.by_suffix.get(word[-length:])
+
+            if not rules:
+                continue
+
+            stem = word[:-length]
+
+            for replacement, pattern in rules:
+                if pattern is None or pattern.search(stem):
+                    return stem + replacement
+
+        return word
+
+
+class Language:
+    """ The keyword rules for one language.
+
+        depluralize maps one lowercase word to its singular. every_word
+        means every word of a keyword is made singular, as adjectives
+        agree with their noun, instead of only the last one. elision is
+        a regex for elided articles to drop, like the l' in l'arbre.
+        compose puts accented letters in NFC form so the same word typed
+        two ways is one keyword. known_words are the words depluralize
+        knows for sure, which tells what language a keyword is in when
+        it could be in several.
+    """
+    def __init__(self, code, name, depluralize, and_or, and_exceptions=(),
+                 short_words=(), latin=NOT_LATIN_SCRIPT, every_word=False, elision=None, compose=True,
+                 known_words=None):
+        self.code = code
+        self.name = name
+        self.depluralize = depluralize
+        self.and_or = frozenset(and_or)
+        self.and_exceptions = frozenset(and_exceptions)
+        self.short_words = frozenset(short_words)
+        self.latin = latin
+        self.every_word = every_word
+        self.elision = elision
+        self.compose = compose
+        self.known_words = frozenset(getattr(depluralize, "known_words", ()) if known_words is None else known_words)
+
+
+def _english():
+    # Exactly the rules this tool has always used
+    return Language(
+        "en", "English", de_pluralize, ["and", "or"], AND_EXCEPTIONS, ["x", "u"],
+        latin=NOT_ASCII, compose=False,
+        known_words=set(singular_uninflected) | set(singular_uncountable) | set(singular_irregular) | set(singular_irregular.values())
+    )
+
+def _french():
+    rules = SuffixRules(
+        [
+            ("eaux", "eau", None),
+            ("yaux", "yau", None),
+            ("aux", "al", None),
+            ("oux", "ou", None),
+            ("eux", "eu", r"^(?:j|f|chev|li|nev|mili|di|essi|adi|épi|vœ|voe)$"),
+            ("s", "", r"[^s]$"),
+        ],
+        irregular={
+            "travaux": "travail", "vitraux": "vitrail", "coraux": "corail", "émaux": "émail",
+            "baux": "bail", "soupiraux": "soupirail", "yeux": "œil", "cieux": "ciel",
+            "aïeux": "aïeul", "messieurs": "monsieur", "mesdames": "madame",
+            "mesdemoiselles": "mademoiselle", "bonshommes": "bonhomme",
+        },
+        invariant=[
+            "des", "les", "mes", "tes", "ses", "ces", "nos", "vos", "leurs", "aux", "sans", "sous",
+            "dans", "vers", "chez", "plus", "moins", "très", "après", "depuis", "parmi",
+            "bras", "corps", "temps", "pays", "fois", "dos", "bois", "mois", "souris", "tapis",
+            "radis", "colis", "avis", "paradis", "permis", "puits", "poids", "repas", "matelas",
+            "verglas", "ananas", "lilas", "canevas", "cas", "tas", "pas", "gras", "bas",
+            "jus", "bus", "virus", "campus", "cactus", "autobus", "rébus", "blocus", "obus",
+            "ours", "os", "fils", "lys", "iris", "anis", "mais", "jadis", "gris", "frais",
+            "épais", "mauvais", "français", "anglais", "japonais", "chinois", "suédois",
+            "succès", "progrès", "procès", "accès", "excès", "cyprès", "congrès", "abcès",
+            "faux", "chaux", "taux", "prix", "choix", "voix", "croix", "noix", "paix", "deux",
+            "heureux", "joyeux", "nombreux", "vieux", "mieux", "curieux", "précieux",
+            "délicieux", "sérieux", "dangereux", "silencieux", "lumineux", "paresseux",
+            "champs", "remords", "legs", "velours", "discours", "concours", "secours",
+            "parcours", "cours", "recours", "alias", "atlas", "kermès", "vis", "brebis",
+            "doux", "roux", "toux", "jaloux", "époux", "houx", "courroux", "palais", "marais",
+            "relais", "chamois", "lotus", "humus", "terminus", "tonus", "papyrus", "eucalyptus",
+            "hibiscus", "rhinocéros", "albatros", "héros", "tournevis", "mépris",
+            "tennis", "pubis", "pénis", "lapis", "oasis", "cassis", "croquis", "coulis", "parvis",
+            "tamis", "maquis", "logis", "débris", "salsifis", "rubis", "gratis", "lis", "paris",
+            "hélas", "mars", "express", "stress", "biceps", "triceps", "forceps", "herpès",
+            "dès", "près", "exprès", "auprès", "univers", "revers", "travers", "divers", "pouls",
+            "cumulus", "cirrus", "stratus", "nimbus", "sinus", "consensus", "bonus", "plexus",
+            "prospectus", "fœtus", "foetus", "rictus", "détritus", "lapsus", "thymus",
+            "dais", "jais", "biais", "rabais", "harnais", "panais", "engrais", "laquais",
+            "repos", "propos", "enclos", "clos", "gros", "tournedos", "chaos", "cosmos", "thermos",
+            "anchois", "bourgeois", "villageois", "sournois", "pois", "hongrois", "danois",
+            "parfois", "autrefois", "toujours", "alors", "ailleurs", "volontiers", "jamais",
+        ],
+    )
+
+    return Language(
+        "fr", "French", rules, ["et", "ou"], ["noir et blanc", "sel et poivre"], ["à", "y"],
+        every_word=True, elision=re.compile(r"\b(?:l|d|j|m|n|s|t|c|qu|jusqu|lorsqu|puisqu)['’](?=\w)")
+    )
+
+def _german():
+    rules = SuffixRules(
+        [
+            ("innen", "in", None),
+            ("ungen", "ung", None),
+            ("heiten", "heit", None),
+            ("keiten", "keit", None),
+            ("schaften", "schaft", None),
+            ("nisse", "nis", None),
+            ("tionen", "tion", None),
+            ("täten", "tät", None),
+            ("ismen", "ismus", None),
+            ("ereien", "erei", None),
+            # Kenntnis, Ergebnis and the like are singular, as are
+            # Arthritis and the other inflammations
+            ("nis", "nis", None),
+            ("itis", "itis", None),
+            # Loanwords like Omas, Taxis, Babys and Radios. The stem needs
+            # a vowel and consonants before its last vowel, so Glas, Gras
+            # and Moos are left alone, and Preis and Mais are no plural
+            ("s", "", r"[aeiouäöüy][^aeiouäöüy]+(?:[aioy]|[ie][ao])$"),
+        ],
+        irregular={
+            "museen": "museum", "zentren": "zentrum", "themen": "thema", "firmen": "firma",
+            "kinder": "kind", "bücher": "buch", "häuser": "haus", "männer": "mann",
+            "frauen": "frau", "bäume": "baum", "vögel": "vogel", "äpfel": "apfel",
+            "blumen": "blume", "katzen": "katze", "hunde": "hund", "pferde": "pferd",
+            "autos": "auto", "fotos": "foto", "zoos": "zoo", "berge": "berg", "wälder": "wald",
+            "blätter": "blatt", "städte": "stadt", "straßen": "straße", "menschen": "mensch",
+        },
+        invariant=[
+            "kürbis", "tennis", "iltis", "basis", "praxis", "chaos", "kosmos", "mythos", "ethos",
+            "pathos", "rhinozeros", "kakao", "radius", "glas", "gras", "gas", "moos", "atlas", "ananas", "iris", "alias", "etwas",
+            "gratis", "dosis", "genesis", "lapis", "penis", "epos", "logos", "eros", "kolchos",
+            "tetanus", "bonus", "zirkus", "kaktus", "status", "globus", "virus", "campus",
+        ],
+    )
+
+    return Language(
+        "de", "German", rules, ["und", "oder"], ["schwarz und weiß", "hell und dunkel"]
+    )
+
+def _spanish():
+    rules = SuffixRules(
+        [
+            ("iones", "ión", None),
+            ("ines", "ín", r"[aeiouáéíóú].*[^aeiouáéíóú]$"),
+            ("anes", "án", r"[aeiouáéíóú].*[^aeiouáéíóú]$"),
+            ("ones", "ón", r"[aeiouáéíóú]"),
+            ("ces", "z", r"[aeiouáéíóú]$"),
+            # Crisis, análisis and artritis are singular
+            ("sis", "sis", None),
+            ("itis", "itis", None),
+            ("es", "", r"[aeiouáéíóú][lnrdjy]$"),
+            ("s", "", r"[aeiouáéíóú]$"),
+        ],
+        irregular={
+            "jóvenes": "joven", "exámenes": "examen", "imágenes": "imagen",
+            "orígenes": "origen", "márgenes": "margen", "volúmenes": "volumen",
+            "crímenes": "crimen", "órdenes": "orden", "caracteres": "carácter",
+            "regímenes": "régimen", "países": "país", "meses": "mes", "ingleses": "inglés",
+            "franceses": "francés", "autobuses": "autobús", "compases": "compás",
+        },
+        invariant=[
+            "los", "las", "unos", "unas", "sus", "mis", "tus", "nos", "vos", "más", "menos",
+            "lunes", "martes", "miércoles", "jueves", "viernes", "crisis", "tesis", "análisis",
+            "dosis", "virus", "tenis", "paraguas", "cumpleaños", "sacacorchos", "abrelatas",
+            "rascacielos", "microondas", "gafas", "tijeras", "pantalones", "oasis", "atlas",
+            "bíceps", "tórax", "fénix", "pies", "dios", "inglés", "francés", "portugués",
+            "japonés", "holandés", "escocés", "irlandés", "danés", "interés", "estrés", "revés",
+            "través", "después", "ciprés", "marqués", "país", "anís", "autobús", "compás",
+            "jamás", "atrás", "además", "arnés", "dos", "tres", "seis", "dieciséis", "veintidós",
+            "veintitrés", "veintiséis", "lejos", "apenas", "quizás", "entonces", "antes",
+            "mientras", "tras", "gratis", "caries", "cactus", "campus", "corpus", "lapsus",
+            "ómnibus", "cosmos", "caos", "adiós", "venus", "iris", "mecenas", "lavavajillas",
+            "cortacésped", "parabrisas", "guardabosques", "limpiaparabrisas",
+        ],
+    )
+
+    return Language(
+        "es", "Spanish", rules, ["y", "e", "o", "u"], ["blanco y negro", "sal y pimienta"],
+        ["a", "y", "o", "e", "u"], every_word=True
+    )
+
+
+# code -> (name, loader)
+_loaders = {
+    "en": ("English", _english),
+    "fr": ("French", _french),
+    "de": ("German", _german),
+    "es": ("Spanish", _spanish),
+}
+_languages = {}
+
+def register_language(code, name, loader):
+    """ Make keyword rules available for a language. loader takes no
+        arguments and returns a Language; it is only called the first
+        time the language is used.
+    """
+    _loaders[code] = (name, loader)
+    _languages.pop(code, None)
+
+def available_languages():
+    return sorted(_loaders)
+
+def language_name(code):
+    return _loaders[code][0]
+
+def get_language(code):
+    """ The Language for a code like "en" or "fr", built on first use.
+    """
+    language = _languages.get(code)
+
+    if language is None:
+        if code not in _loaders:
+            raise ValueError(f"No keyword rules for language '{code}'. Known: {', '.join(available_languages())}")
+
+        language = _loaders[code][1]()
+
+        # Words repeat across keywords, so each language keeps a memo.
+        # English already caches inside de_pluralize.
+        if language.depluralize is not de_pluralize:
+            language.depluralize = functools.lru_cache(maxsize=65536)(language.depluralize)
+
+        language = _languages.setdefault(code, language)
+
+    return language
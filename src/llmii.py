@@ -1,150 +1,20 @@
-import os, json, time, re, argparse, exiftool, threading, queue, calendar, io, uuid, requests
+import os, sys, json, time, re, argparse, exiftool, threading, queue, calendar, io, uuid, requests
 from json_repair import repair_json as rj
 from datetime import timedelta
 from .image_processor import ImageProcessor
-from .llmii_utils import first_json, de_pluralize, AND_EXCEPTIONS
-    
-def split_on_internal_capital(word):
-    """ Split a word if it contains a capital letter after the 4th position.
-        Returns the original word if no split is needed, or the split 
-        version if a capital is found.
-        
-        Examples:
-            BlueSky -> Blue Sky
-            microService -> micro Service
-    """
-    if len(word) <= 4:
-        return word
-    
-    for i in range(4, len(word)):
-        if word[i].isupper():
-            return word[:i] + " " + word[i:]
-            
-    return word
-
-def normalize_keyword(keyword, banned_words, config=None):
-    """ Normalizes keywords according to specific rules:
-        - Splits unhyphenated compound words on internal capitals
-        - Max words determined by config (default 2) unless middle word is 'and'/'or' (then +1)
-        - If split_and_entries enabled, remove and/or unless in exceptions list
-        - Hyphens between alphanumeric chars count as two words
-        - Cannot start with 3+ digits if no_digits_start is enabled
-        - Each word must be 2+ chars if min_word_length enabled (unless it is x or u)
-        - Removes all non-alphanumeric except spaces and valid hyphens
-        - Checks against banned words if ban_prompt_words enabled
-        - Makes singular if depluralize_keywords enabled
-        - Returns lowercase result
-    """   
-    if config is None:
-        class DefaultConfig:
-            def __init__(self):
-                self.normalize_keywords = True
-                self.depluralize_keywords = True
-                self.limit_word_count = True
-                self.max_words_per_keyword = 2
-                self.split_and_entries = True
-                self.ban_prompt_words = True
-                self.no_digits_start = True
-                self.min_word_length = True
-                self.latin_only = True
-        
-        config = DefaultConfig()
-    
-    if not config.normalize_keywords:
-        return keyword.strip()
-    
-    if not isinstance(keyword, str):
-        keyword = str(keyword)
-    
-    # Handle internal capitalization before lowercase conversion
-    words = keyword.strip().split()
-    split_words = []
-    
-    for word in words:
-        split_words.extend(split_on_internal_capital(word).split())
-    
-    keyword = " ".join(split_words)
-    
-    # Convert to lowercase after handling capitals
-    keyword = keyword.lower().strip()
-    
-    # Remove non-Latin characters if latin_only is enabled
-    if config.latin_only:
-        keyword = re.sub(r'[^\x00-\x7F]', '', keyword)
-    
-    # Remove all non-alphanumeric chars except spaces and hyphens
-    keyword = re.sub(r'[^\w\s-]', '', keyword)
-    
-    # Replace multiple spaces/hyphens with single space/hyphen
-    keyword = re.sub(r'\s+', ' ', keyword)
-    keyword = re.sub(r'-+', '-', keyword)
-    keyword = re.sub(r'_', ' ', keyword)
-    
-    # For validation, we'll track both original tokens and split words
-    tokens = keyword.split()
-    words = []
-    
-    # Validate and collect words for length checking
-    for token in tokens:    
-        
-        # Handle hyphenated words
-        if '-' in token:
-            
-            # Check if hyphen is between alphanumeric chars
-            if not re.match(r'^[\w]+-[\w]+$', token):
-                return None
-           
-            # Add hyphenated parts to words list for validation
-            parts = token.split('-')
-            words.extend(parts)
-        
-        else:
-            words.append(token)
-    
-    # Validate word count if limit_word_count is enabled
-    if config.limit_word_count:
-        max_words = config.max_words_per_keyword
-        if len(words) > max_words + 1:
-            return None
-        
-    # Handle and/or splitting if enabled
-    if config.split_and_entries and len(words) == 3 and words[1] in ['and', 'or']:
-        if ' '.join(words) in AND_EXCEPTIONS:
-            pass
-        else:
-            # Remove and/or and make singular if depluralize_keywords is enabled
-            if config.depluralize_keywords:
-                tokens = [de_pluralize(words[0]), de_pluralize(words[2])]
-            else:
-                tokens = [words[0], words[2]]
-    
-    # Word validation
-    for word in words:
-        
-        # Check minimum length if enabled
-        if config.min_word_length:
-            if len(word) < 2 and word not in ['x', 'u']:
-                return None
-        
-        # Check for banned words if enabled
-        if config.ban_prompt_words and word in banned_words:
-            return None
-    
-    # Check if starts with 3+ digits if enabled
-    if config.no_digits_start and re.match(r'^\d{3,}', words[0]):
-        return None
-    
-    # Make words singular if depluralize_keywords is enabled
-    if config.depluralize_keywords:
-        # Make solo words singular
-        if len(words) == 1:
-            tokens = [de_pluralize(words[0])]
-        # If two or more words make the last word singular
-        elif len(tokens) > 1:
-            tokens[-1] = de_pluralize(tokens[-1])
-    
-    # Return the original tokens (preserving hyphens)
-    return ' '.join(tokens)
+from .llmii_utils import json_candidates, continues_json, IncrementalJsonParser
+from .keywords import split_on_internal_capital, normalize_keyword, normalize_keywords, normalize_mixed_keywords
+from .xmp_utils import sniff_xmp, write_xmp_sidecar
+from .backup import BackupManager, restore_backups, MWG_BLOCKS
+from .manifest import DirectoryManifest
+from .watcher import DirectoryWatcher
+from .scheduler import WorkScheduler, SCHEDULE_POLICIES
+from .dedupe import DuplicateFinder
+from .ignore import IgnoreRules
+from .progress import ProgressTracker, format_progress, format_duration
+from .languages import available_languages, language_name
+from .renormalize import Renormalizer
+from .budget import TokenBudget
     
 def clean_string(data):
     """ Makes sure the string is clean for addition
@@ -164,6 +34,9 @@ def clean_string(data):
     
     return data
     
+# A ```json fenced block in a chatty answer
+JSON_FENCE = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+
 def clean_json(data):
     """ LLMs like to return all sorts of garbage.
         Even when asked to give a structured output
@@ -171,6 +44,11 @@ def clean_json(data):
         they chose certain things. This function 
         will pull basically anything useful and turn it
         into a dict
+        
+        A well formed answer is loaded as is. Otherwise the text is
+        scanned once for top level objects, preferring the first one
+        that mentions keywords. Only that one is repaired if it does
+        not load, so the cost stays linear in the length of the answer.
     """
     if data is None:
         
@@ -182,47 +60,133 @@ def clean_json(data):
     
     if isinstance(data, str):
         # Try to extract JSON markdown code
-        pattern = r"```json\s*(.*?)\s*```"
-        match = re.search(pattern, data, re.DOTALL)
+        match = JSON_FENCE.search(data)
         if match:
             data = match.group(1).strip()
 
         try:
-           return json.loads(rj(data))
+            result = json.loads(data)
+            
+            if isinstance(result, dict):
+                return result
         
-        except:
+        except Exception:
             pass
         
-        try:
-            # first_json will return the first json found in a string
-            # repair_json tries to repair json using some heuristics
-            return json.loads(rj(first_json(data)))
+        parsed = None
+        chosen = None
+        first_start = None
+        first_candidate = None
         
-        except:
-            pass    
+        for start, end in json_candidates(data):
+            candidate = data[start:end]
+            mentions_keywords = "keywords" in candidate.lower()
+            
+            if first_start is None:
+                first_start = start
+                first_candidate = candidate
+            
+            if end is not None and (parsed is None or mentions_keywords):
+                try:
+                    result = json.loads(candidate)
+                    
+                    if isinstance(result, dict):
+                        if mentions_keywords:
+                            return result
+                        
+                        parsed = result
+                
+                except Exception:
+                    pass
+            
+            # The one mentioning keywords is the answer, not an aside
+            if chosen is None and mentions_keywords:
+                chosen = candidate
+        
+        # Keywords after a stray closing brace belong to the first object
+        if chosen is None and first_start is not None and "keywords" in data[first_start:].lower():
+            chosen = data[first_start:]
+        
+        if chosen is None and parsed is None:
+            chosen = first_candidate
+        
+        if chosen is not None:
+            try:
+                # repair_json tries to repair json using some heuristics
+                result = json.loads(rj(chosen))
+                
+                if isinstance(result, dict):
+                    return result
+            
+            except Exception:
+                pass
+        
+        if parsed is not None:
+            return parsed
         
         try:    
             # The nuclear option - wrap whatever it is around brackets and load it
             # Hopefully normalize_keywords will take care of any garbage
-            result = json.loads(first_json(rj("{" + data + "}")))
+            result = json.loads(rj("{" + data + "}"))
             
-            if result.get("Keywords"):
+            if isinstance(result, dict) and result.get("Keywords"):
                 
                 return result
         
-        except:
+        except Exception:
             pass
        
     return None
 
 
+# The line of the default instructions that names the language and
+# the shape of the answer
+LANGUAGE_LINE = re.compile(r"^Use [A-Z]+ only\..*$", re.MULTILINE)
+
+def multilingual_instruction(instruction, languages):
+    """ Rewrite an instruction to ask for the Description and Keywords
+        in every language of languages in one answer, keyed by
+        language code.
+    """
+    names = ", ".join(f"{language_name(code).upper()} ({code})" for code in languages)
+    shape = ", ".join(f'"{code}": {{"Description": str, "Keywords": []}}' for code in languages)
+    line = (
+        f"Write the Description and Keywords in each of these languages: {names}. "
+        f"The example shows a single language only. Generate ONLY a JSON object with one key "
+        f"per language code as follows {{{shape}}}"
+    )
+    
+    if LANGUAGE_LINE.search(instruction):
+        return LANGUAGE_LINE.sub(lambda match: line, instruction, count=1)
+    
+    return instruction.rstrip() + "\n\n" + line
+
+def parse_languages(value):
+    """ argparse type for a comma separated list of language codes.
+    """
+    languages = [code.strip().lower() for code in value.split(",") if code.strip()]
+    
+    for code in languages:
+        if code not in available_languages():
+            raise argparse.ArgumentTypeError(
+                f"no keyword rules for '{code}', choose from {', '.join(available_languages())}"
+            )
+    
+    return list(dict.fromkeys(languages))
+
 class Config:
     def __init__(self):
         self.directory = None
+        self.directories = []
+        self.files_from = None
         self.api_url = None
         self.api_password = None
         self.no_crawl = False
         self.no_backup = False
+        self.backup_mode = "auto"
+        self.restore = False
+        self.renormalize = False
+        self.renormalize_workers = 4
         self.dry_run = False
         self.update_keywords = False
         self.reprocess_failed = False
@@ -238,6 +202,21 @@ class Config:
         self.no_caption = False
         self.update_caption = False
         self.use_sidecar = False
+        self.sidecar_formats = []
+        self.sidecar_size_mb = 0
+        self.batch_size = 250
+        self.crawl_threads = 1
+        self.full_scan = False
+        self.watch = False
+        self.watch_settle = 5
+        self.watch_interval = 2
+        self.queue_chunks = 4
+        self.schedule = "crawl"
+        self.dedupe = False
+        self.exclude = []
+        self.progress_json = False
+        self.include = []
+        self.schedule_window = 2000
         self.normalize_keywords = True
         self.depluralize_keywords = True
         self.limit_word_count = True
@@ -247,6 +226,13 @@ class Config:
         self.no_digits_start = True  
         self.min_word_length = True
         self.latin_only = True
+        self.keyword_language = "en"
+        self.languages = []
+        self.stream = False
+        self.continuations = 1
+        self.adaptive_tokens = False
+        self.min_gen_count = 64
+        self.max_gen_count = 1024
         self.caption_instruction = "Describe the image. Be specific"
         self.system_instruction = "You describe the image and generate keywords."
         self.keyword_instruction = ""
@@ -324,7 +310,11 @@ OUTPUT=```json{"Description": "Two apples next to each other, one green and one
     @classmethod
     def from_args(cls):
         parser = argparse.ArgumentParser(description="Image Indexer")
-        parser.add_argument("directory", help="Directory containing the files")
+        parser.add_argument("directories", nargs="*", help="Directories containing the files")
+        parser.add_argument(
+            "--files-from", metavar="FILE",
+            help="Read the files to process from FILE, or stdin if FILE is -, one per line or NUL separated"
+        )
         parser.add_argument(
             "--api-url", default="http://localhost:5001", help="URL for the LLM API"
         )
@@ -339,6 +329,20 @@ OUTPUT=```json{"Description": "Two apples next to each other, one green and one
             action="store_true",
             help="Don't make a backup of files before writing",
         )
+        parser.add_argument(
+            "--backup-mode", choices=["auto", "reflink", "metadata", "exiftool"], default="auto",
+            help="auto uses a reflink copy where the filesystem supports it and otherwise journals the original tags, exiftool makes a full copy"
+        )
+        parser.add_argument(
+            "--restore", action="store_true", help="Restore the backups made by earlier runs and exit"
+        )
+        parser.add_argument(
+            "--renormalize", action="store_true",
+            help="Apply the current keyword settings to keywords already written, without running the model"
+        )
+        parser.add_argument(
+            "--renormalize-workers", type=int, default=4, help="Number of files read and written at the same time with --renormalize"
+        )
         parser.add_argument(
             "--dry-run", action="store_true", help="Don't write any files"
         )
@@ -351,6 +355,13 @@ OUTPUT=```json{"Description": "Two apples next to each other, one green and one
         parser.add_argument(
             "--use-sidecar", action="store_true", help="Store generated data in an xmp sidecare instead of the image file"
         )
+        parser.add_argument(
+            "--sidecar-formats", type=lambda value: [item.strip().upper() for item in value.split(",") if item.strip()],
+            default=[], help="Comma separated file types to always write to a sidecar, for example RAW,TIFF"
+        )
+        parser.add_argument(
+            "--sidecar-size-mb", type=float, default=0, help="Write to a sidecar for files at least this many MB (0 to disable)"
+        )
         parser.add_argument(
             "--reprocess-orphans", action="store_true", help="If a file has a UUID, determine its status"
         )
@@ -371,24 +382,106 @@ OUTPUT=```json{"Description": "Two apples next to each other, one green and one
         parser.add_argument(
             "--normalize-keywords", action="store_true", help="Enable keyword normalization"
         )
+        parser.add_argument(
+            "--keyword-language", choices=available_languages(), default="en",
+            help="Language whose plural rules and letters are used when normalizing keywords"
+        )
+        parser.add_argument(
+            "--languages", type=parse_languages, default=[], metavar="CODES",
+            help="Comma separated languages, e.g. fr,en. Each image gets a caption and keywords in all of them from one request. The first is the main caption"
+        )
         parser.add_argument("--res-limit", type=int, default=448, help="Limit the resolution of the image")
+        parser.add_argument(
+            "--adaptive-tokens", action="store_true",
+            help="Learn how many tokens the model needs for each task and use that instead of --gen-count"
+        )
+        parser.add_argument("--min-gen-count", type=int, default=64, help="Lowest token budget --adaptive-tokens will use")
+        parser.add_argument("--max-gen-count", type=int, default=1024, help="Highest token budget --adaptive-tokens will use")
+        parser.add_argument(
+            "--continuations", type=int, default=1,
+            help="How many times to ask the model to go on with an answer cut off by the token limit before retrying it (0 to always retry)"
+        )
+        parser.add_argument(
+            "--stream", action="store_true",
+            help="Stream answers from the API and stop generating as soon as the JSON answer is complete"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=250, help="Number of files read from ExifTool at a time"
+        )
+        parser.add_argument(
+            "--watch", action="store_true", help="Keep running and process new or changed images as they appear"
+        )
+        parser.add_argument(
+            "--watch-settle", type=float, default=5, help="Seconds a new file must stay unchanged before it is processed"
+        )
+        parser.add_argument(
+            "--watch-interval", type=float, default=2,
+            help="Seconds between checks for new files with --watch, and between directory scans without watchdog"
+        )
+        parser.add_argument(
+            "--full-scan", action="store_true", help="Ignore the directory manifest and look at every directory again"
+        )
+        parser.add_argument(
+            "--exclude", action="append", default=[], metavar="PATTERN",
+            help="Skip files and folders matching a gitignore style pattern, for example @eaDir/ or *.lrprev. Can be repeated"
+        )
+        parser.add_argument(
+            "--include", action="append", default=[], metavar="PATTERN",
+            help="Process matching files even if an exclude pattern or .llmiiignore file matched them. Can be repeated"
+        )
+        parser.add_argument(
+            "--progress-json", action="store_true", help="Print progress as one JSON object per line for other tools to read"
+        )
+        parser.add_argument(
+            "--dedupe", action="store_true", help="Recognize hardlinks and identical copies of processed files and reuse their result"
+        )
+        parser.add_argument(
+            "--schedule", choices=SCHEDULE_POLICIES, default="crawl",
+            help="Order to process files in: crawl order, newest first, smallest first, grouped by format, shortest estimated job first or round-robin across top level folders"
+        )
+        parser.add_argument(
+            "--schedule-window", type=int, default=2000, help="Number of files the scheduler looks ahead at when ordering"
+        )
+        parser.add_argument(
+            "--crawl-threads", type=int, default=1, help="Number of directories listed at the same time. Raise this on network drives"
+        )
         args = parser.parse_args()
+        
+        if not args.directories and not args.files_from:
+            parser.error("give at least one directory or --files-from")
 
         config = cls()
         
         for key, value in vars(args).items():
             setattr(config, key, value)
         
+        config.directory = args.directories[0] if args.directories else None
+        
         return config
 
+    def root_directories(self):
+        """ The directories to crawl. The GUI only sets directory.
+        """
+        if self.directories:
+            return list(self.directories)
+        
+        return [self.directory] if self.directory else []
+
 class LLMProcessor:
     def __init__(self, config):
         self.api_url = config.api_url
         self.config = config
         self.instruction = config.instruction
+        
+        # One request answers for every language
+        if config.languages:
+            self.instruction = multilingual_instruction(config.instruction, config.languages)
+            
         self.system_instruction = config.system_instruction
         self.caption_instruction = config.caption_instruction
-        self.requests = requests
+        
+        # A session keeps the connection to the API open between images
+        self.requests = requests.Session()
         self.api_password = config.api_password
         self.max_tokens = config.gen_count
         self.temperature = 0.1
@@ -397,6 +490,16 @@ class LLMProcessor:
         self.top_k = 0
         self.min_p = 1.05
         
+        # How far the last streamed JSON answer got
+        self.stream_progress = None
+        
+        # Why the last answer ended, how often it was continued and the
+        # tokens it took
+        self.last_answer = None
+        
+        # The model the API says it is running, for the token budgets
+        self.model = None
+        self.budget = TokenBudget(config.min_gen_count, config.max_gen_count) if config.adaptive_tokens else None
 
     def describe_content(self, task="", processed_image=None):
         if not processed_image:
@@ -404,6 +507,8 @@ class LLMProcessor:
             
             return None
         
+        max_tokens = self.max_tokens
+        
         if task == "caption":
             instruction = self.caption_instruction
         
@@ -417,6 +522,29 @@ class LLMProcessor:
             print(f"invalid task: {task}")
             
             return None
+        
+        # The answer repeats for every language
+        if task != "caption" and self.config.languages:
+            max_tokens = int(max_tokens) * len(self.config.languages)
+        
+        json_answer = task != "caption"
+        budget_task = task if not json_answer or not self.config.languages else f"{task} {','.join(self.config.languages)}"
+        
+        if self.budget:
+            previous = self.budget.chosen.get((self.model or "unknown", budget_task))
+            max_tokens = self.budget.budget(self.model, budget_task, max_tokens)
+            
+            if max_tokens != previous:
+                print(f"Token budget for {budget_task} with {self.model or 'this model'}: {max_tokens}")
+                
+        self.last_answer = {
+            "task": task,
+            "finish_reason": None,
+            "truncated": False,
+            "continuations": 0,
+            "completion_tokens": None,
+            "max_tokens": max_tokens,
+        }
             
         try:
             messages = [
@@ -435,73 +563,527 @@ class LLMProcessor:
                 }
             ]
             
-            payload = {
-                "messages": messages,
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-                "top_k": self.top_k,
-                "min_p": self.min_p
-            }
-            
-            endpoint = f"{self.api_url}/v1/chat/completions"
-            headers = {
-                "Content-Type": "application/json"
-            }
-            if self.api_password:
-                headers["Authorization"] = f"Bearer {self.api_password}"
-            
-            response = self.requests.post(
-                endpoint,
-                json=payload,
-                headers=headers
-            )
+            text = self.request_completion(messages, max_tokens, json_answer)
             
-            response.raise_for_status()
-            response_json = response.json()
+            # Tokens of the answer that is kept, not of every request
+            kept_tokens = self.last_answer["completion_tokens"]
             
-            if "choices" in response_json and len(response_json["choices"]) > 0:
-                if "message" in response_json["choices"][0]:
-                    return response_json["choices"][0]["message"]["content"]
+            # An answer cut off by max_tokens is continued rather than
+            # asked for again. The image and instruction are the same
+            # prefix as before, so the backend reuses its prompt cache and
+            # only the rest of the answer is generated.
+            while (
+                json_answer and text
+                and self.last_answer["finish_reason"] == "length"
+                and self.last_answer["continuations"] < self.config.continuations
+                and not IncrementalJsonParser().feed(text)
+            ):
+                self.last_answer["continuations"] += 1
+                used = self.last_answer["completion_tokens"] or 0
+                more = self.request_completion(
+                    messages + [{"role": "assistant", "content": text}], max_tokens, json_answer, prefix=text
+                )
+                
+                if not more:
+                    break
+                
+                more_tokens = None
+                
+                if self.last_answer["completion_tokens"] is not None:
+                    more_tokens = self.last_answer["completion_tokens"] - used
+                
+                # A backend that ignores the partial answer starts over
+                if continues_json(text, more):
+                    text += more
+                    
+                    if more_tokens is not None:
+                        kept_tokens = (kept_tokens or 0) + more_tokens
+                
                 else:
-                    return response_json["choices"][0].get("text", "")
-            return None
+                    text = more
+                    kept_tokens = more_tokens
+            
+            if self.budget:
+                self.budget.observe(
+                    self.model, budget_task, kept_tokens,
+                    truncated=self.last_answer["finish_reason"] == "length"
+                )
+            
+            return text
             
         except Exception as e:
             print(f"Error in API call: {str(e)}")
             return None
+    
+    def request_completion(self, messages, max_tokens, json_answer=True, prefix=""):
+        """ Send one chat completion and return its text. Why it ended
+            and the tokens it used go in last_answer. prefix is the part
+            of the answer the messages already end with.
+        """
+        payload = {
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "top_k": self.top_k,
+            "min_p": self.min_p
+        }
+        
+        if self.config.stream:
+            payload["stream"] = True
+        
+        endpoint = f"{self.api_url}/v1/chat/completions"
+        headers = {
+            "Content-Type": "application/json"
+        }
+        if self.api_password:
+            headers["Authorization"] = f"Bearer {self.api_password}"
+        
+        response = self.requests.post(
+            endpoint,
+            json=payload,
+            headers=headers,
+            stream=self.config.stream
+        )
+        
+        response.raise_for_status()
+        
+        if self.config.stream:
+            return self.read_stream(response, json_answer, prefix)
+            
+        response_json = response.json()
+        self.model = response_json.get("model") or self.model
+        self.count_usage(response_json.get("usage"))
+        
+        if "choices" in response_json and len(response_json["choices"]) > 0:
+            self.set_finish_reason(response_json["choices"][0].get("finish_reason"))
+            
+            if "message" in response_json["choices"][0]:
+                return response_json["choices"][0]["message"]["content"]
+            else:
+                return response_json["choices"][0].get("text", "")
+        return None
+    
+    def set_finish_reason(self, reason):
+        self.last_answer["finish_reason"] = reason
+        
+        if reason == "length":
+            self.last_answer["truncated"] = True
+    
+    def count_usage(self, usage):
+        """ Add up completion tokens over the requests for one answer.
+        """
+        if not isinstance(usage, dict) or usage.get("completion_tokens") is None:
+            return
+        
+        self.last_answer["completion_tokens"] = (self.last_answer["completion_tokens"] or 0) + usage["completion_tokens"]
+    
+    def read_stream(self, response, json_answer=True, prefix=""):
+        """ Collect the text of a streamed completion. A JSON answer is
+            followed as it arrives and the stream is dropped once the
+            object has closed, so whatever the model would add after it
+            is never generated.
+        """
+        parser = IncrementalJsonParser() if json_answer else None
+        pieces = []
+        usage_reported = False
+        
+        if parser and prefix:
+            parser.feed(prefix)
+        
+        try:
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                
+                data = line[5:].strip()
+                
+                if data == b"[DONE]":
+                    break
+                
+                try:
+                    event = json.loads(data)
+                
+                except ValueError:
+                    continue
+                
+                self.model = event.get("model") or self.model
+                
+                if event.get("usage"):
+                    usage_reported = True
+                    self.count_usage(event["usage"])
+                    
+                choices = event.get("choices") or []
+                
+                if not choices:
+                    continue
+                
+                if choices[0].get("finish_reason"):
+                    self.set_finish_reason(choices[0]["finish_reason"])
+                
+                text = (choices[0].get("delta") or {}).get("content") or choices[0].get("text") or ""
+                pieces.append(text)
+                
+                if parser and parser.feed(text):
+                    self.set_finish_reason("stop")
+                    self.stop_generation()
+                    
+                    break
+        
+        finally:
+            response.close()
+        
+        # Usage comes last, so a stream dropped early has none. Servers
+        # send about one token per event.
+        if not usage_reported:
+            self.count_usage({"completion_tokens": sum(1 for piece in pieces if piece)})
+        
+        self.stream_progress = parser.progress() if parser else None
+        
+        return "".join(pieces)
+    
+    def stop_generation(self):
+        """ Closing the stream does not stop every backend, so ask
+            KoboldCpp to abort. Other servers just ignore this.
+        """
+        try:
+            self.requests.post(f"{self.api_url}/api/extra/abort", json={}, timeout=5)
+        
+        except Exception:
+            pass
+
+def build_extension_map(image_extensions):
+    """ Flatten {"RAW": [".nef", ...]} into {".nef": "RAW", ...} so the
+        type of a file is a single dict lookup.
+    """
+    return {ext.lower(): file_type for file_type, extensions in image_extensions.items() for ext in extensions}
+
+def file_extension(filename):
+    """ Lowercase extension including the dot, or "" if there is none.
+    """
+    dot = filename.rfind(".")
+    
+    if dot == -1:
+        return ""
+    
+    return filename[dot:].lower()
+
+def read_path_list(source, block_size=65536):
+    """ Yield paths from a file or from stdin if source is "-". Paths
+        may be separated by NUL, as from find -print0, or by newlines.
+        The input is read in blocks so a list of any length is streamed.
+    """
+    stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+    separator = None
+    remainder = b""
+    
+    try:
+        while True:
+            block = stream.read(block_size)
+            
+            if not block:
+                break
+            
+            data = remainder + block
+            
+            # NUL cannot appear in a path so its presence decides the format
+            if separator is None:
+                if b"\0" in data:
+                    separator = b"\0"
+                
+                elif b"\n" in data:
+                    separator = b"\n"
+                
+                else:
+                    remainder = data
+                    
+                    continue
+            
+            items = data.split(separator)
+            remainder = items.pop()
+            
+            for item in items:
+                if separator == b"\n":
+                    item = item.rstrip(b"\r")
+                
+                if item:
+                    yield os.fsdecode(item)
+        
+        remainder = remainder.rstrip(b"\r\n\0")
+        
+        if remainder:
+            yield os.fsdecode(remainder)
+    
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+# How process_file results are counted in the progress
+PROGRESS_OUTCOMES = {
+    "success": "processed",
+    "failed": "failed",
+    "skipped": "skipped",
+    "reused": "reused",
+}
 
 class BackgroundIndexer(threading.Thread):
-    def __init__(self, root_dir, metadata_queue, file_extensions, no_crawl=False):
+    """ Finds the files to process and puts them on the metadata queue
+        in chunks. Files come from a list of paths if one is given and
+        from crawling each of the root directories.
+    """
+    def __init__(self, root_dirs, metadata_queue, extension_map, no_crawl=False, batch_size=250, crawl_threads=1, manifest=None, files_from=None, ignore=None, progress=None, duplicates=None):
         threading.Thread.__init__(self)
-        self.root_dir = root_dir
+        
+        if isinstance(root_dirs, str):
+            root_dirs = [root_dirs]
+        
+        self.root_dirs = list(root_dirs or [])
+        self.files_from = files_from
+        self.ignore = ignore
+        self.progress = progress
+        self.duplicates = duplicates
+        self.files_not_found = 0
+        self.manifest = manifest
         self.metadata_queue = metadata_queue
-        self.file_extensions = file_extensions
+        self.extension_map = extension_map
         self.no_crawl = no_crawl
+        self.batch_size = max(1, int(batch_size))
+        self.crawl_threads = max(1, int(crawl_threads))
         self.total_files_found = 0
         self.indexing_complete = False
+        self.stop_event = threading.Event()
+        self.count_lock = threading.Lock()
+        
+        # Shared state for the parallel walk
+        self.pending = []
+        self.active_listings = 0
+        self.pending_condition = threading.Condition()
         
     def run(self):
-        if self.no_crawl:
-            self._index_directory(self.root_dir)
+        try:
+            if self.files_from:
+                self._read_files_from(self.files_from)
+            
+            for root_dir in self.root_dirs:
+                if self.stop_event.is_set():
+                    break
+                
+                self._walk(root_dir)
         
-        else:
-            for root, _, _ in os.walk(self.root_dir):
-                self._index_directory(root)
-        self.indexing_complete = True
+        except OSError as e:
+            print(f"Could not read file list: {str(e)}")
+        
+        finally:
+            self.indexing_complete = True
 
-    def _index_directory(self, directory):
+    def _read_files_from(self, source):
+        """ Queue the images named in a path list. Consecutive paths in
+            the same directory are chunked together, so a list sorted by
+            directory gives the same chunks as a crawl.
+        """
+        directory = None
         files = []
         
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
+        for path in read_path_list(source):
+            if file_extension(path) not in self.extension_map:
+                continue
+            
+            if self.ignore and self.ignore.ignored_path(path):
+                continue
+            
+            if not os.path.isfile(path):
+                self.files_not_found += 1
+                
+                continue
+            
+            path = os.path.normpath(path)
+            parent = os.path.dirname(path)
+            
+            if files and (parent != directory or len(files) >= self.batch_size):
+                if not self._put_chunk(directory, files):
+                    return
+                files = []
             
-            if os.path.isfile(file_path) and any(file_path.lower().endswith(ext) for ext in self.file_extensions):
-                files.append(file_path)
+            directory = parent
+            files.append(path)
         
         if files:
-            self.total_files_found += len(files)
-            self.metadata_queue.put((directory, files))
+            self._put_chunk(directory, files)
+
+    def stop(self):
+        """ Ask the indexer to stop crawling. Unblocks a pending put
+            on a full queue.
+        """
+        self.stop_event.set()
+
+    def _walk(self, root_dir):
+        """ Depth first walk in the same order as os.walk, but each
+            directory is listed exactly once and the listing gives us
+            both the subdirectories and the files.
+        """
+        if self.crawl_threads > 1 and not self.no_crawl:
+            return self._walk_parallel(root_dir)
+        
+        pending = [root_dir]
+        
+        while pending and not self.stop_event.is_set():
+            subdirectories = self._visit(pending.pop())
+            
+            if not self.no_crawl:
+                pending.extend(reversed(subdirectories))
+
+    def _walk_parallel(self, root_dir):
+        """ Walk with several listing threads sharing one stack of
+            directories. On network filesystems the listing latency
+            dominates, so having several listings in flight hides it.
+            The stack keeps the walk roughly depth first so files from
+            the same subtree still arrive together.
+        """
+        self.pending = [root_dir]
+        self.active_listings = 0
+        
+        threads = [
+            threading.Thread(target=self._listing_worker, daemon=True)
+            for _ in range(self.crawl_threads)
+        ]
+        
+        for thread in threads:
+            thread.start()
+        
+        for thread in threads:
+            thread.join()
+
+    def _listing_worker(self):
+        while True:
+            with self.pending_condition:
+                while not self.pending and self.active_listings and not self.stop_event.is_set():
+                    self.pending_condition.wait(0.5)
+                
+                # Done when nothing is waiting and nobody can add more
+                if self.stop_event.is_set() or not self.pending:
+                    self.pending_condition.notify_all()
+                    
+                    return
+                
+                directory = self.pending.pop()
+                self.active_listings += 1
+            
+            subdirectories = []
+            
+            try:
+                subdirectories = self._visit(directory)
+            
+            finally:
+                with self.pending_condition:
+                    self.pending.extend(reversed(subdirectories))
+                    self.active_listings -= 1
+                    self.pending_condition.notify_all()
+
+    def _visit(self, directory):
+        """ Index a directory unless the manifest says nothing in it has
+            changed since every file in it was finished. Returns the
+            subdirectories to walk into.
+        """
+        subdirectories = None
+        
+        if self.manifest:
+            subdirectories = self.manifest.unchanged_subdirectories(directory)
+        
+        if subdirectories is None:
+            subdirectories = self._index_directory(directory)
+        
+        # Pruned here so excluded subtrees are never listed
+        if self.ignore and subdirectories:
+            rules = self.ignore.rules_for(directory)
+            subdirectories = [path for path in subdirectories if not self.ignore.excluded(rules, path, is_dir=True)]
+        
+        return subdirectories
+
+    def _index_directory(self, directory):
+        """ Stream the image files of a directory onto the queue in
+            chunks of batch_size so that huge flat folders never sit
+            in memory as one list or one ExifTool call. Returns the
+            subdirectories found.
+        """
+        files = []
+        subdirectories = []
+        extension_map = self.extension_map
+        rules = self.ignore.rules_for(directory) if self.ignore else ()
+        ignored = 0
+        
+        if self.manifest:
+            self.manifest.begin_listing(directory)
+        
+        try:
+            entries = os.scandir(directory)
+        
+        except OSError:
+            if self.manifest:
+                self.manifest.end_listing(directory, subdirectories, complete=False)
+            
+            return subdirectories
+        
+        with entries:
+            for entry in entries:
+                try:
+                    # DirEntry caches the type from the listing so
+                    # these normally cost no extra stat call
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                        
+                        continue
+                    
+                    if file_extension(entry.name) not in extension_map or not entry.is_file():
+                        continue
+                
+                except OSError:
+                    continue
+                
+                if rules and self.ignore.excluded(rules, entry.path):
+                    ignored += 1
+                    
+                    continue
+                
+                files.append(entry.path)
+                
+                if len(files) >= self.batch_size:
+                    if not self._put_chunk(directory, files):
+                        return []
+                    files = []
+        
+        complete = self._put_chunk(directory, files) if files else True
+        
+        if self.manifest:
+            self.manifest.end_listing(directory, subdirectories, complete, ignored)
+        
+        return subdirectories
+
+    def _put_chunk(self, directory, files):
+        """ Put a chunk on the queue, blocking while it is full so the
+            crawler never runs far ahead of processing.
+        """
+        if self.manifest:
+            self.manifest.chunk_queued(directory, len(files))
+        
+        while not self.stop_event.is_set():
+            try:
+                self.metadata_queue.put((directory, files), timeout=0.5)
+                
+                with self.count_lock:
+                    self.total_files_found += len(files)
+                
+                if self.progress:
+                    self.progress.found(files)
+                
+                if self.duplicates:
+                    self.duplicates.found(files)
+                
+                return True
+            
+            except queue.Full:
+                continue
+        
+        return False
 
 class FileProcessor:
     def __init__(self, config, check_paused_or_stopped=None, callback=None):
@@ -523,8 +1105,20 @@ class FileProcessor:
         
         self.files_in_queue = 0
         self.total_processing_time = 0
+        
+        # Why the last generate_metadata asked for a retry
+        self.retry_reason = None
         self.files_processed = 0
         self.files_completed = 0
+        self.files_skipped = 0
+        self.writes_skipped = 0
+        self.lock = threading.Lock()
+        
+        # Each thread keeps the sidecar names of the directory it is in
+        self._sidecar_local = threading.local()
+        self.sidecars_enabled = bool(config.use_sidecar or config.sidecar_formats or config.sidecar_size_mb)
+        self.backups = BackupManager(config.backup_mode)
+        self.duplicates = DuplicateFinder() if config.dedupe else None
         
         self.image_processor = ImageProcessor(max_dimension=self.config.res_limit, patch_sizes=[14])
         
@@ -568,18 +1162,73 @@ class FileProcessor:
             "XMP:Status"
         ]
         
+        # The caption in each extra language is its own xml:lang alternative
+        self.language_caption_fields = [f"XMP:Description-{code}" for code in config.languages]
+        
         self.image_extensions = config.image_extensions
-        self.metadata_queue = queue.Queue()
+        self.extension_map = build_extension_map(self.image_extensions)
+        
+        # Bounded so memory stays flat no matter how many files are found
+        self.metadata_queue = queue.Queue(maxsize=config.queue_chunks)
+        
+        # Files that are all finished in unchanged directories are not crawled again
+        self.root_dirs = config.root_directories()
+        self.progress = ProgressTracker(self.extension_map)
+        self.ignore = IgnoreRules(self.root_dirs, config.exclude, config.include)
+        
+        self.manifest = DirectoryManifest(
+            self.root_dirs or [os.getcwd()],
+            self.extension_map,
+            enabled=not (config.full_scan or config.reprocess_all or config.reprocess_failed or config.renormalize),
+            rules=self.ignore.signature()
+        )
         
         self.indexer = BackgroundIndexer(
-            config.directory, 
+            self.root_dirs, 
             self.metadata_queue, 
-            [ext for exts in self.image_extensions.values() for ext in exts], 
-            config.no_crawl
+            self.extension_map, 
+            config.no_crawl,
+            config.batch_size,
+            config.crawl_threads,
+            self.manifest,
+            config.files_from,
+            self.ignore,
+            self.progress,
+            self.duplicates
         )
         
         self.indexer.start()
         
+        self.scheduler = WorkScheduler(
+            config.schedule,
+            self.metadata_queue,
+            self.extension_map,
+            self.root_dirs,
+            config.batch_size,
+            config.schedule_window,
+            self.progress.estimate
+        )
+        
+        # New arrivals go on their own queue so they can jump the backlog
+        self.watcher = None
+        self.watch_queue = queue.Queue()
+        
+        if config.watch and not self.root_dirs:
+            self.callback("Nothing to watch without a directory")
+        
+        elif config.watch:
+            self.watcher = DirectoryWatcher(
+                self.root_dirs,
+                self.watch_queue,
+                self.extension_map,
+                config.no_crawl,
+                config.watch_settle,
+                config.watch_interval,
+                self.ignore
+            )
+            self.watcher.start()
+            self.callback(f"Watching {', '.join(self.root_dirs)} for new images ({self.watcher.mode})")
+        
     def get_file_type(self, file_ext):
         """ If the filetype is supported, return the key
             so .nef would return RAW. Otherwise return
@@ -588,20 +1237,17 @@ class FileProcessor:
         if not file_ext.startswith("."):
             file_ext = "." + file_ext
         
-        file_ext = file_ext.lower()
-        
-        for file_type, extensions in self.image_extensions.items():
-            if file_ext in [ext.lower() for ext in extensions]:
-                
-                return file_type
-        
-        return None
+        return self.extension_map.get(file_ext.lower())
 
     def check_uuid(self, metadata, file_path):
         """ Very important or we end up processing 
             files more than once
+            
+            Returns the metadata to process, None if the file is done
+            and False if it could not be checked.
         """ 
         try:
+            existing = dict(metadata)
             status = metadata.get("XMP:Status")
             identifier = metadata.get("XMP:Identifier")
             keywords = metadata.get("MWG:Keywords")
@@ -612,7 +1258,7 @@ class FileProcessor:
                     metadata["XMP:Status"] = "success"                    
                     status = "success"
                     try:
-                        written = self.write_metadata(file_path, metadata)
+                        written = self.write_metadata(file_path, metadata, existing)
                         
                         if written and not self.config.reprocess_all:
                             
@@ -622,10 +1268,10 @@ class FileProcessor:
                         else:
                             print(f"Metadata write error for orphan: {file_path}")
                             self.callback(f"Metadata write error for orphan: {file_path}")
-                            return None
+                            return False
                     except:
                         print("Error writing orphan status")
-                        return None
+                        return False
         
             # Does file have a UUID in metadata
             if identifier:
@@ -667,7 +1313,7 @@ class FileProcessor:
         except Exception as e:
             print(f"Error checking UUID: {str(e)}")
             
-            return None
+            return False
                         
     def check_pause_stop(self):
         if self.check_paused_or_stopped():
@@ -683,12 +1329,11 @@ class FileProcessor:
     def list_files(self, directory):
         directory = os.path.normpath(directory)
         files = []
-        for filename in os.listdir(directory):
-            file_path = os.path.normpath(os.path.join(directory, filename))
-            
-            if os.path.isfile(file_path):
-                if self.get_file_type(os.path.splitext(filename)[1].lower()):
-                    files.append(file_path)
+        
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if file_extension(entry.name) in self.extension_map and entry.is_file():
+                    files.append(os.path.normpath(entry.path))
         
         if files:
             self.files_in_queue += len(files)
@@ -699,16 +1344,29 @@ class FileProcessor:
         return files
                 
     def process_directory(self, directory):
+        chunks_done = 0
+        
         try:
-            while not (self.indexer.indexing_complete and self.metadata_queue.empty()):
+            while self.watcher or not self.crawl_finished():
                 if self.check_pause_stop():
                     return
                 
                 try:
-                    directory, files = self.metadata_queue.get(timeout=1)
+                    directory, files = self._next_chunk()
                     self.callback(f"Processing directory: {directory}")
                     self.callback(f"---")
-                    metadata_list = self._get_metadata_batch(files)
+                    chunk_size = len(files)
+                    chunk_files = files
+                    read_start = time.time()
+                    files = self._triage_files(files)
+                    finished = chunk_size - len(files)
+                    metadata_list = self._get_metadata_batch(files) if files else []
+                    self.progress.timed("read", None, time.time() - read_start, chunk_size)
+                    
+                    # ExifTool failed for the whole batch
+                    if files and not metadata_list:
+                        for file_path in files:
+                            self.progress.finished(file_path, "failed")
                     
                     for metadata in metadata_list:
                         if metadata:
@@ -725,6 +1383,7 @@ class FileProcessor:
                                         self.callback(f"\n{source_file}: failed to validate. Skipping!")
                                         self.callback(f"---")
                                         self.files_processed +=1
+                                        self.progress.finished(source_file, "failed")
                                         
                                         continue
                                                        
@@ -737,7 +1396,7 @@ class FileProcessor:
                             new_metadata = {}
                             
                             # Check if we actually have a sidecar in the path
-                            if self.config.use_sidecar and metadata["SourceFile"].lower().endswith(".xmp"):
+                            if self.sidecars_enabled and metadata["SourceFile"].lower().endswith(".xmp"):
                                 
                                 # Remove the xmp so we reference the image
                                 metadata["SourceFile"] = os.path.splitext(metadata["SourceFile"])[0]
@@ -759,6 +1418,8 @@ class FileProcessor:
                                     identifier = value
                                 if key in self.status_fields:
                                     status = value
+                                if key in self.language_caption_fields:
+                                    new_metadata[key] = value
                                     
                             # Standardize the fields                             
                             if keywords:
@@ -772,29 +1433,197 @@ class FileProcessor:
                                 
                             self.files_processed += 1
                             
-                            self.process_file(new_metadata)
+                            result = self.process_file(new_metadata)
+                            self.progress.finished(new_metadata["SourceFile"], PROGRESS_OUTCOMES.get(result, "failed"))
+                            self.send_progress()
+                            
+                            if result in PROGRESS_OUTCOMES:
+                                finished += 1
 
                         if self.check_pause_stop():
                             return
                     
+                    if self.duplicates:
+                        self.duplicates.done(chunk_files)
+                    
+                    self.manifest.chunk_finished(directory, chunk_size, finished == chunk_size)
+                    chunks_done += 1
+                    
+                    if chunks_done % 100 == 0:
+                        if not self.config.dry_run:
+                            self.manifest.save()
+                        
+                        if self.llm_processor.budget:
+                            self.llm_processor.budget.save()
+                    
                     self.update_progress()
                     
                 except queue.Empty:
                     continue
         finally:
+            self.finish()
+
+    def finish(self):
+        """ Stop the crawl, save what should last and report the run.
+            Every mode that takes files from the queue ends with this.
+        """
+        self.indexer.stop()
+        
+        if self.watcher:
+            self.watcher.stop()
+        
+        # Nothing was written in a dry run so nothing is finished
+        if not self.config.dry_run:
+            self.manifest.save()
+        
+        if self.llm_processor.budget:
+            self.llm_processor.budget.save()
+        
+        if self.indexer.files_not_found:
+            self.callback(f"Skipped {self.indexer.files_not_found} listed files that do not exist")
+        
+        if self.ignore.files_ignored or self.ignore.directories_pruned:
+            self.callback(
+                f"Ignored {self.ignore.files_ignored} files and pruned {self.ignore.directories_pruned} directories"
+            )
+        
+        if self.manifest.directories_skipped:
+            self.callback(f"Skipped {self.manifest.directories_skipped} unchanged directories")
+        
+        if self.writes_skipped:
+            self.callback(f"Skipped {self.writes_skipped} metadata writes with no changes")
+        
+        if self.duplicates:
+            self.duplicates.report(self.callback)
+        
+        try:
+            self.et.terminate()
+            self.callback("ExifTool process terminated cleanly")
+            
+        except Exception as e:
+            self.callback(f"Warning: ExifTool termination error: {str(e)}")
+
+    def _next_chunk(self):
+        """ Return the next (directory, files) to process. Files the
+            watcher just saw arrive come before the crawl backlog.
+            Raises queue.Empty if nothing arrived within a second.
+        """
+        try:
+            return self._watched(self.watch_queue.get_nowait())
+        
+        except queue.Empty:
+            pass
+        
+        if self.watcher and self.crawl_finished():
+            return self._watched(self.watch_queue.get(timeout=1))
+        
+        return self.scheduler.get(timeout=1)
+
+    def _watched(self, chunk):
+        self.progress.found(chunk[1])
+        
+        if self.duplicates:
+            self.duplicates.found(chunk[1])
+        
+        return chunk
+
+    def crawl_finished(self):
+        """ True once the crawl is done and every file it found has
+            been handed out.
+        """
+        return self.indexer.indexing_complete and self.metadata_queue.empty() and self.scheduler.empty()
+
+
+    def _sidecars_in(self, directory):
+        """ Names of the existing xmp sidecars in a directory. Only the
+            most recent directory of each thread is kept since chunks
+            arrive in order.
+        """
+        listing = getattr(self._sidecar_local, "listing", None)
+        
+        if listing is None or listing[0] != directory:
             try:
-                self.et.terminate()
-                self.callback("ExifTool process terminated cleanly")
+                names = {name for name in os.listdir(directory) if name.lower().endswith(".xmp")}
+            
+            except OSError:
+                names = set()
                 
-            except Exception as e:
-                self.callback(f"Warning: ExifTool termination error: {str(e)}")
+            listing = self._sidecar_local.listing = (directory, names)
+        
+        return listing[1]
+
+    def _metadata_path(self, file_path):
+        """ Return the file that holds the tracking metadata for an image,
+            which is the sidecar if we are using sidecars and one exists.
+        """
+        if self.sidecars_enabled:
+            directory, filename = os.path.split(file_path)
+            
+            if filename + ".xmp" in self._sidecars_in(directory):
+                return file_path + ".xmp"
+        
+        return file_path
+
+    def uses_sidecar(self, file_path):
+        """ Decide where metadata for a file is written. Embedding into
+            a large TIFF or a RAW makes ExifTool rewrite the whole file,
+            so those can go to a sidecar instead. Once a file has a
+            sidecar it keeps using it so reads find the Identifier and
+            Status where they were written.
+        """
+        if self.config.use_sidecar:
+            return True
+        
+        if not self.sidecars_enabled:
+            return False
+        
+        if self._metadata_path(file_path) != file_path:
+            return True
+        
+        if self.get_file_type(os.path.splitext(file_path)[1]) in self.config.sidecar_formats:
+            return True
+        
+        if self.config.sidecar_size_mb:
+            try:
+                return os.path.getsize(file_path) >= self.config.sidecar_size_mb * 1024 * 1024
+            
+            except OSError:
+                return False
+        
+        return False
+
+    def _triage_files(self, files):
+        """ Drop files that are already finished according to their XMP
+            packet so ExifTool is only asked about files that might need
+            work. Anything the sniffer cannot decide goes to ExifTool.
+        """
+        if self.config.reprocess_all:
+            return files
+        
+        remaining = []
+        
+        for file_path in files:
+            sniffed = sniff_xmp(self._metadata_path(file_path))
+            
+            if sniffed and sniffed["XMP:Identifier"]:
+                status = sniffed["XMP:Status"]
                 
+                if status == "success" or (status == "failed" and not self.config.reprocess_failed):
+                    self.files_processed += 1
+                    self.files_skipped += 1
+                    self.progress.finished(file_path, "skipped")
+                    
+                    continue
+            
+            remaining.append(file_path)
+        
+        return remaining
 
     def _get_metadata_batch(self, files):
         """ Get metadata for a batch of files
             using persistent ExifTool instance.
         """
-        exiftool_fields = self.keyword_fields + self.caption_fields + self.identifier_fields + self.status_fields 
+        exiftool_fields = self.keyword_fields + self.caption_fields + self.identifier_fields + self.status_fields + self.language_caption_fields
         
         try:
             if self.config.skip_verify:
@@ -804,17 +1633,9 @@ class FileProcessor:
             
             # Use sidecars if they exist for metadata instead of images because
             # that is where we will have put the UUID and Status info
-            if self.config.use_sidecar:
-                xmp_files = []
-                for file in files:
-                    
-                    # Check for files named file.ext.xmp for sidecar
-                    if os.path.exists(file + ".xmp"):
-                       xmp_files.append(file  + ".xmp")
-
-                    else:
-                        xmp_files.append(file)
-                files = xmp_files
+            # Check for files named file.ext.xmp for sidecar
+            if self.sidecars_enabled:
+                files = [self._metadata_path(file) for file in files]
             return self.et.get_tags(files, tags=exiftool_fields, params=params)
             
         except Exception as e:
@@ -823,19 +1644,42 @@ class FileProcessor:
             return []
 
     def update_progress(self):
-        files_processed = self.files_processed
-        files_remaining = self.indexer.total_files_found - files_processed
+        progress = self.progress_snapshot()
+        self.callback(f"Batch processed. {format_progress(progress)}")
+        self.callback(f"---")
+        self.send_progress(progress)
+
+    def progress_snapshot(self):
+        # While watching more files can always arrive
+        progress = self.progress.snapshot(self.indexer.indexing_complete and not self.watcher)
         
-        if files_remaining < 0:
-            files_remaining = 0
+        if self.llm_processor.budget:
+            progress["token_budgets"] = self.llm_processor.budget.current()
+            
+        return progress
+
+    def send_progress(self, progress=None):
+        """ Hand the structured progress to the GUI, and print it as a
+            JSON line if asked to.
+        """
+        if progress is None:
+            progress = self.progress_snapshot()
         
-        self.callback(f"Directory processed. Files remaining in queue: {files_remaining}")
-        self.callback(f"---")
+        if self.config.progress_json:
+            print(json.dumps(progress), flush=True)
+        
+        # The CLI gets the text version from update_progress
+        if self.callback is not print:
+            self.callback(progress)
         
     
     def process_file(self, metadata):
         """ Process a file and update its metadata in one operation.
             This minimizes the number of writes to the file.
+            
+            Returns "success" or "failed" once that status is stored,
+            "skipped" if the file needed no work, "reused" if the result
+            of a duplicate was written, or None otherwise.
         """
         try:    
             
@@ -850,10 +1694,15 @@ class FileProcessor:
                 self.callback(f"---")
                 return
             
+            # Keep what was read so we only write what changed
+            existing = dict(metadata)
+            
             # Check UUID and status
             metadata = self.check_uuid(metadata, file_path)
-            if not metadata:
+            if metadata is False:
                 return
+            if not metadata:
+                return "skipped"
                 
             image_type = self.get_file_type(os.path.splitext(file_path)[1].lower())
             if image_type is None:
@@ -861,31 +1710,51 @@ class FileProcessor:
                 self.callback(f"---")
                 return
                 
+            # A copy of a file we already did gets the same result
+            if self.duplicates:
+                reused = self.duplicates.find(file_path, existing)
+                
+                if reused:
+                    metadata.update(reused)
+                    self.callback(f"Duplicate of a processed file: {file_path}")
+                    self.callback(f"---")
+                    
+                    if not self.config.dry_run and not self.write_metadata(file_path, metadata, existing):
+                        return
+                    
+                    return "reused"
+            
             # Process the file
             start_time = time.time()
             
             processed_image, image_path = self.image_processor.process_image(file_path)
+            decoded_time = time.time()
+            self.progress.timed("decode", image_type, decoded_time - start_time)
             updated_metadata = self.generate_metadata(metadata, processed_image)
            
             status = updated_metadata.get("XMP:Status")
             
             # Retry one time if failed
             if not self.config.quick_fail and status == "retry":
-                print(f"Retrying {file_path} once")
-                self.callback(f"Retrying {file_path}...")
+                print(f"Retrying {file_path} once ({self.retry_reason})")
+                self.callback(f"Retrying {file_path} ({self.retry_reason})...")
                 self.callback(f"---")
+                self.progress.retry(self.retry_reason)
                 updated_metadata = self.generate_metadata(metadata, processed_image)      
                 status = updated_metadata.get("XMP:Status")
             
+            inferred_time = time.time()
+            self.progress.timed("inference", image_type, inferred_time - decoded_time)
+            
             # If retry didn't work, mark failed
             if not status == "success":
-                print(f"Failed: {file_path}")
-                self.callback(f"Retry failed: {file_path}")
+                print(f"Failed: {file_path} ({self.retry_reason})")
+                self.callback(f"Retry failed: {file_path} ({self.retry_reason})")
                 self.callback(f"---")
                 metadata["XMP:Status"] = "failed"
                 
-                if not self.config.dry_run:
-                    self.write_metadata(file_path, metadata)
+                if not self.config.dry_run and self.write_metadata(file_path, metadata, existing):
+                    return "failed"
                 return
                 
             # Send image data to callback for GUI display
@@ -902,31 +1771,25 @@ class FileProcessor:
                 
                 # Send the image data to the callback
                 self.callback(image_data)    
+            
+            # Fingerprint before writing since writing changes the bytes
+            if self.duplicates:
+                self.duplicates.remember(self.duplicates.fingerprint(file_path), existing, updated_metadata)
                 
-            if not self.config.dry_run:
-                self.write_metadata(file_path, updated_metadata)
+            if not self.config.dry_run and not self.write_metadata(file_path, updated_metadata, existing):
+                status = "write error"
                 
             print(f"{file_path}: {status}")
             end_time = time.time()
+            self.progress.timed("write", image_type, end_time - inferred_time)
             processing_time = end_time - start_time
             self.total_processing_time += processing_time
             self.files_completed += 1
             
             # Calculate and display progress info
-            in_queue = self.indexer.total_files_found - self.files_processed
+            progress = self.progress_snapshot()
             average_time = self.total_processing_time / self.files_completed
-            time_left = average_time * in_queue
-            time_left_unit = "s"
             
-            if time_left > 180:
-                time_left = time_left / 60
-                time_left_unit = "mins"
-            
-            if time_left < 0:
-                time_left = 0
-            
-            if in_queue < 0:
-                in_queue = 0
             if status == "success":
                  
                 self.callback(f"<b>Image:</b> {os.path.basename(file_path)}")
@@ -940,12 +1803,13 @@ class FileProcessor:
                     f"<b>Processing time:</b> {processing_time:.2f}s, <b>Average processing time:</b> {average_time:.2f}s"
                 )
                 self.callback(
-                    f"<b>Processed:</b> {self.files_processed}, <b>In queue:</b> {in_queue}, <b>Time remaining (est):</b> {time_left:.2f}{time_left_unit}"
+                    f"<b>Processed:</b> {self.files_processed}, <b>In queue:</b> {progress['remaining']}, <b>Time remaining (est):</b> {format_duration(progress['eta_seconds'])}"
                 )
                 self.callback("---")   
                 
-            if self.check_pause_stop():
-                return
+            self.check_pause_stop()
+            
+            return status if status == "success" else None
             
         except Exception as e:
             print(f"<b>Error processing:</b> {file_path}: {str(e)}")
@@ -977,7 +1841,9 @@ class FileProcessor:
             
             # Determine whether to generate caption, keywords, or both
             if not self.config.no_caption and self.config.detailed_caption:
-                data = clean_json(self.llm_processor.describe_content(task="keywords", processed_image=processed_image))
+                response = self.llm_processor.describe_content(task="keywords", processed_image=processed_image)
+                answer = self.llm_processor.last_answer
+                data = self.split_languages(clean_json(response))
                 detailed_caption = clean_string(self.llm_processor.describe_content(task="caption", processed_image=processed_image))               
                 
                 if existing_caption and self.config.update_caption:
@@ -990,7 +1856,9 @@ class FileProcessor:
                     keywords = data.get("Keywords")
                    
             else:
-                data = clean_json(self.llm_processor.describe_content(task="caption_and_keywords", processed_image=processed_image))
+                response = self.llm_processor.describe_content(task="caption_and_keywords", processed_image=processed_image)
+                answer = self.llm_processor.last_answer
+                data = self.split_languages(clean_json(response))
                          
                 if isinstance(data, dict):
                     keywords = data.get("Keywords")
@@ -1009,13 +1877,32 @@ class FileProcessor:
                         
             if not keywords:
                 status = "retry"
+                
+                if not response:
+                    self.retry_reason = "no answer"
+                
+                elif answer and answer["finish_reason"] == "length":
+                    self.retry_reason = "cut off"
+                
+                else:
+                    self.retry_reason = "no keywords"
                             
             else:
                 status = "success"
                 keywords = self.process_keywords(metadata, keywords)
+                
+                # A cut off answer that was continued, or whose keywords
+                # could be parsed anyway, saved a full retry
+                if answer and answer["truncated"]:
+                    self.progress.truncated(answer["continuations"], answer["finish_reason"] == "length")
 
             new_metadata["MWG:Description"] = caption
             new_metadata["MWG:Keywords"] = keywords
+            
+            if isinstance(data, dict) and not self.config.no_caption:
+                for code, text in data.get("Descriptions", {}).items():
+                    new_metadata[f"XMP:Description-{code}"] = text
+                    
             new_metadata["XMP:Status"] = status
             new_metadata["XMP:Identifier"] = metadata.get("XMP:Identifier", str(uuid.uuid4()))
             new_metadata["SourceFile"] = file_path
@@ -1026,26 +1913,140 @@ class FileProcessor:
             self.callback(f"Parse error for {file_path}: {str(e)}")
             self.callback(f"---")
             metadata["XMP:Status"] = "retry"
+            self.retry_reason = "parse error"
             
             return metadata
             
-    def write_metadata(self, file_path, metadata):
-        """Write metadata using persistent ExifTool instance"""
+    def split_languages(self, data):
+        """ Turn an answer keyed by language code into the usual shape
+            with the first language's Description, a dict of keywords
+            by language and a dict of Descriptions by language. Keys may
+            also be language names. A plain single language answer counts
+            as the first language. Without languages data is unchanged.
+        """
+        languages = self.config.languages
+        
+        if not languages or not isinstance(data, dict):
+            return data
+        
+        aliases = {}
+        
+        for code in languages:
+            aliases[code] = code
+            aliases[language_name(code).lower()] = code
+            
+        answers = {}
+        
+        for key, value in data.items():
+            code = aliases.get(str(key).strip().lower())
+            
+            if code and isinstance(value, dict):
+                answers[code] = value
+                
+        if not answers and ("Keywords" in data or "Description" in data):
+            answers[languages[0]] = data
+            
+        keywords = {}
+        descriptions = {}
+        
+        for code in languages:
+            answer = answers.get(code, {})
+            
+            if answer.get("Keywords"):
+                keywords[code] = answer["Keywords"]
+                
+            if answer.get("Description"):
+                descriptions[code] = str(answer["Description"])
+        
+        return {
+            "Description": descriptions.get(languages[0]),
+            "Keywords": keywords,
+            "Descriptions": descriptions,
+        }
+    
+    def _as_list(self, value):
+        if value is None:
+            return []
+        
+        if not isinstance(value, list):
+            value = [value]
+        
+        return [str(item) for item in value]
+    
+    def changed_tags(self, metadata, existing):
+        """ Return only the tags in metadata whose values differ from
+            the metadata that was read from the file. Keywords are
+            compared as sets since their order carries no meaning.
+            Tags set to None are never written.
+        """
+        changed = {}
+        
+        for key, value in metadata.items():
+            if key == "SourceFile" or value is None:
+                continue
+            
+            old_value = existing.get(key)
+            
+            if key == "MWG:Keywords":
+                if set(self._as_list(value)) == set(self._as_list(old_value)):
+                    continue
+            
+            elif old_value is not None and str(value) == str(old_value):
+                continue
+                
+            changed[key] = value
+        
+        return changed
+    
+    def write_metadata(self, file_path, metadata, existing=None, et=None):
+        """ Write metadata using persistent ExifTool instance.
+            If the existing metadata is given, only changed tags are
+            written and nothing is written when nothing changed.
+            Threads writing at the same time pass their own et.
+        """
+        et = et or self.et
+
         if self.config.dry_run:
             print("Dry run. Not writing.")
             
             return True
+        
+        use_sidecar = self.uses_sidecar(file_path)
+        
+        # A new sidecar has to hold everything, not just what changed
+        if use_sidecar and self._metadata_path(file_path) == file_path:
+            existing = None
+            
+        if existing is not None:
+            metadata = self.changed_tags(metadata, existing)
+            
+            if not metadata:
+                with self.lock:
+                    self.writes_skipped += 1
+                
+                return True
 
         try:
+            if use_sidecar:
+                return self._write_sidecar(file_path, metadata, et)
+            
             params = ["-P"]
             
-            if self.config.no_backup or self.config.use_sidecar:
+            if self.config.no_backup:
+                params.append("-overwrite_original")
+            
+            # Our own backup is much smaller than the full copy ExifTool makes
+            elif existing is not None and self.backups.backup(
+                file_path, lambda: self._original_tags(file_path, metadata, existing, et)
+            ):
                 params.append("-overwrite_original")
-            if self.config.use_sidecar:
-                file_path = file_path + ".xmp"
                 
             # Use existing ExifTool instance
-            self.et.set_tags(file_path, tags=metadata, params=params)
+            et.set_tags(file_path, tags=metadata, params=params)
+            
+            # Our own write is not a new image
+            if self.watcher:
+                self.watcher.wrote(file_path)
             
             return True
             
@@ -1055,45 +2056,120 @@ class FileProcessor:
             self.callback(f"---")
             return False 
     
+    def _original_tags(self, file_path, metadata, existing, et):
+        """ The values the tags about to be written have now, for the
+            backup journal. The MWG composites are read back from each
+            block they are stored in, since a restore has to put back
+            what every block held. Returns None if they cannot be read.
+        """
+        tags = {key: existing.get(key) for key in metadata if key not in MWG_BLOCKS}
+        blocks = [tag for key in metadata for tag in MWG_BLOCKS.get(key, [])]
+        
+        if not blocks:
+            return tags
+        
+        try:
+            results = et.get_tags([file_path], tags=blocks)
+        
+        except Exception as e:
+            print(f"Could not read the original metadata of {file_path}: {str(e)}")
+            
+            return None
+        
+        values = results[0] if results else {}
+        
+        # ExifTool reports XMP-dc:Subject as XMP:Subject
+        for tag in blocks:
+            group, name = tag.split(":", 1)
+            tags[tag] = values.get(f"{group.split('-')[0]}:{name}")
+        
+        return tags
+    
+    def _write_sidecar(self, file_path, metadata, et=None):
+        """ Write an xmp sidecar natively, falling back to ExifTool if the
+            existing sidecar cannot be parsed.
+        """
+        sidecar_path = file_path + ".xmp"
+        tags = {key: value for key, value in metadata.items() if key != "SourceFile"}
+        
+        try:
+            write_xmp_sidecar(sidecar_path, tags)
+        
+        except Exception as e:
+            print(f"Native sidecar write failed for {sidecar_path}, using ExifTool: {str(e)}")
+            (et or self.et).set_tags(sidecar_path, tags=metadata, params=["-P", "-overwrite_original"])
+        
+        directory, filename = os.path.split(sidecar_path)
+        
+        listing = getattr(self._sidecar_local, "listing", None)
+        
+        if listing and listing[0] == directory:
+            listing[1].add(filename)
+        
+        return True
+    
     def process_keywords(self, metadata, new_keywords):
         """ Normalize extracted keywords and deduplicate them.
             If update is configured, combine the old and new keywords.
+            Existing keywords come first and the order is stable so
+            reprocessing a file does not reorder its keywords.
+            
+            new_keywords may be a dict of keywords by language code,
+            each normalized with the rules for its language. Existing
+            keywords are then only changed by rules of one of those
+            languages that would not mangle them.
         """
-        all_keywords = set()
+        keywords = []
               
         if self.config.update_keywords:
             existing_keywords = metadata.get("MWG:Keywords", [])
             
             if isinstance(existing_keywords, str):
-                existing_keywords = existing_keywords.split(",").strip()
+                existing_keywords = [keyword.strip() for keyword in existing_keywords.split(",")]
                 
-            for keyword in existing_keywords:
-                normalized = normalize_keyword(keyword, self.banned_words, self.config)
-            
-                if normalized:
-                    all_keywords.add(normalized)
+            keywords.extend(existing_keywords)
                            
-        for keyword in new_keywords:
-            normalized = normalize_keyword(keyword, self.banned_words, self.config)
+        if isinstance(new_keywords, dict):
+            # Keywords already on the file can be in any of the languages
+            all_keywords = normalize_mixed_keywords(
+                keywords, self.banned_words, self.config, list(self.config.languages) + list(new_keywords)
+            )
             
-            if normalized:
-                all_keywords.add(normalized)
+            for code, language_keywords in new_keywords.items():
+                all_keywords.extend(normalize_keywords(language_keywords, self.banned_words, self.config, language=code))
+                
+            all_keywords = list(dict.fromkeys(all_keywords))
+            
+        else:
+            keywords.extend(new_keywords)
+            all_keywords = normalize_keywords(keywords, self.banned_words, self.config)
 
         if all_keywords:        
-            return list(all_keywords)
+            return all_keywords
         else:
             return None
         
 def main(config=None, callback=None, check_paused_or_stopped=None):
     if config is None:
         config = Config.from_args()
+    
+    if config.restore:
+        with exiftool.ExifToolHelper(encoding='utf-8') as et:
+            for directory in config.root_directories():
+                restore_backups(directory, et, config.no_crawl, callback or print)
+        
+        return
              
     file_processor = FileProcessor(
         config, check_paused_or_stopped, callback
     )      
     
     try:
-        file_processor.process_directory(config.directory)
+        if config.renormalize:
+            Renormalizer(file_processor, config.renormalize_workers).run()
+
+        else:
+            file_processor.process_directory(config.directory)
     
     except Exception as e:
         print(f"An error occurred during processing: {str(e)}")
@@ -0,0 +1,502 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import re
+import types
+import shutil
+import importlib
+import tempfile
+import subprocess
+from .config import RESOURCES_DIR
+from .llmii import clean_json, clean_string, Config, FileProcessor
+from .llmii_utils import JsonParser, IncrementalJsonParser, continues_json, _de_pluralize_cached, de_pluralize
+from .llmii_utils import singular_rules, singular_uninflected, singular_uncountable, singular_ie, singular_irregular, plural_prepositions
+from .keywords import KeywordNormalizer, DEFAULT_CONFIG, NORMALIZE_SETTINGS, normalize_mixed_keywords
+
+CORPUS_PATH = os.path.join(RESOURCES_DIR, "bench_corpus.json")
+
+
+class NoBaseline(Exception):
+    """ The code at the baseline revision cannot run this case.
+    """
+
+
+def _repair_json(case):
+    return JsonParser(case["input"]).repair_json()
+
+def _split_json(case):
+    return JsonParser(case["input"]).to_array_of_plain_strings_or_json()
+
+def _incremental(case):
+    parser = IncrementalJsonParser()
+    text = case["input"]
+    size = case.get("chunk", 4)
+
+    for i in range(0, len(text), size):
+        if parser.feed(text[i:i + size]):
+            break
+
+    return {"text": parser.text(), "progress": parser.progress()}
+
+
+def reference_de_pluralize(word):
+    """ de_pluralize as a plain scan over the rule lists, the way it was
+        written before the rules were compiled and indexed.
+    """
+    if not word:
+        return word
+
+    lower_cased_word = word.lower()
+
+    if word.endswith('ss'):
+        return word
+
+    if lower_cased_word in set(singular_uninflected + singular_uncountable):
+        return word
+
+    if "-" in word:
+        words = word.split("-")
+
+        if len(words) > 1 and words[1] in plural_prepositions:
+            return reference_de_pluralize(words[0]) + "-" + "-".join(words[1:])
+
+    if any(lower_cased_word.endswith(w + "s") for w in singular_ie):
+        return word[:-1]
+
+    for plural, singular_form in singular_irregular.items():
+        if re.search(f"({plural})$", word, re.IGNORECASE):
+            return re.sub(f"(?i){plural}$", singular_form, word)
+
+    for rule, replacement in singular_rules:
+        if re.search(rule, word, re.IGNORECASE):
+            return re.sub(rule, replacement, word)
+
+    return word
+
+def load_revision(revision):
+    """ Import the modules in src as they were at a git revision. Returns
+        (llmii, llmii_utils) and the directory to remove afterwards.
+    """
+    root = os.path.dirname(RESOURCES_DIR)
+    names = subprocess.run(
+        ["git", "ls-tree", "--name-only", revision, "src/"],
+        cwd=root, capture_output=True, text=True, check=True
+    ).stdout.split()
+    directory = tempfile.mkdtemp(prefix="llmii-bench-")
+    package = "llmii_revision_" + "".join(char for char in revision if char.isalnum())
+    os.makedirs(os.path.join(directory, package))
+
+    for name in names:
+        if name.endswith(".py"):
+            source = subprocess.run(["git", "show", f"{revision}:{name}"], cwd=root, capture_output=True, check=True).stdout
+
+            with open(os.path.join(directory, package, os.path.basename(name)), "wb") as f:
+                f.write(source)
+
+    open(os.path.join(directory, package, "__init__.py"), "w").close()
+    sys.path.insert(0, directory)
+
+    try:
+        return importlib.import_module(package + ".llmii"), importlib.import_module(package + ".llmii_utils"), directory
+
+    finally:
+        sys.path.remove(directory)
+
+def baseline_functions(llmii, utils, banned_words):
+    """ The bench functions as the code at an older revision does them.
+        Keyword lists are normalized one keyword at a time and repeats
+        dropped, which is what process_keywords did before it kept a
+        stable order. Other languages and the newer functions have no
+        baseline.
+    """
+    def settings(case):
+        if case.get("language", "en") != "en":
+            raise NoBaseline
+
+        config = types.SimpleNamespace(**{name: getattr(DEFAULT_CONFIG, name) for name in NORMALIZE_SETTINGS})
+        config.__dict__.update(case.get("settings", {}))
+
+        return config
+
+    def normalize_keyword(case):
+        return llmii.normalize_keyword(case["input"], banned_words, settings(case))
+
+    def normalize_keywords(case):
+        config = settings(case)
+        results = []
+
+        for keyword in case["input"]:
+            normalized = llmii.normalize_keyword(keyword, banned_words, config)
+
+            if normalized and normalized not in results:
+                results.append(normalized)
+
+        return results
+
+    return {
+        "clean_json": lambda case: llmii.clean_json(case["input"]),
+        "clean_string": lambda case: llmii.clean_string(case["input"]),
+        "repair_json": lambda case: utils.JsonParser(case["input"]).repair_json(),
+        "split_json": lambda case: utils.JsonParser(case["input"]).to_array_of_plain_strings_or_json(),
+        "de_pluralize": lambda case: utils.de_pluralize(case["input"]),
+        "normalize_keyword": normalize_keyword,
+        "normalize_keywords": normalize_keywords,
+    }
+
+
+class Bench:
+    """ Runs the text post-processing functions over a corpus of
+        realistic model answers and keyword lists.
+
+        Each case in the corpus has an input and the expected output,
+        recorded from the code before the speedups with --update
+        --baseline. Where the output was changed on purpose the case has
+        an intentional_change with the reason and the baseline output,
+        and the expected output is the current one. Cases the baseline
+        cannot run are recorded from the current code. check() reports
+        every case whose output differs and time() measures each
+        function over its cases. Memos are cleared before every timed
+        round, so the numbers are for keywords seen for the first time.
+    """
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.banned_words = corpus.get("banned_words", [])
+        self.functions = {
+            "clean_json": lambda case: clean_json(case["input"]),
+            "clean_string": lambda case: clean_string(case["input"]),
+            "repair_json": _repair_json,
+            "split_json": _split_json,
+            "incremental_json": _incremental,
+            "continues_json": lambda case: continues_json(case["input"]["text"], case["input"]["more"]),
+            "de_pluralize": lambda case: de_pluralize(case["input"]),
+            "normalize_keyword": lambda case: self.normalizer(case)(case["input"]),
+            "normalize_keywords": lambda case: self.normalizer(case).normalize_all(case["input"]),
+            "mixed_keywords": lambda case: normalize_mixed_keywords(case["input"], self.banned_words, languages=case["languages"]),
+            "keywords_round_trip": self.round_trip,
+        }
+        self.reset()
+
+    def reset(self):
+        """ Forget memoized results.
+        """
+        self.normalizers = {}
+        _de_pluralize_cached.cache_clear()
+
+    def normalizer(self, case):
+        """ A normalizer for the case's language and settings. Settings
+            not given in the case have their defaults.
+        """
+        settings = dict(case.get("settings", {}))
+        settings.setdefault("keyword_language", case.get("language", "en"))
+        key = tuple(sorted(settings.items()))
+        normalizer = self.normalizers.get(key)
+
+        if normalizer is None:
+            config = types.SimpleNamespace(**{name: getattr(DEFAULT_CONFIG, name) for name in NORMALIZE_SETTINGS})
+            config.__dict__.update(settings)
+            normalizer = self.normalizers[key] = KeywordNormalizer(self.banned_words, config)
+
+        return normalizer
+
+    def round_trip(self, case):
+        """ Write keywords by language like a --languages run, then
+            process the file again with update_keywords. The keywords
+            should come back identical.
+        """
+        config = Config()
+        config.update_keywords = True
+        config.languages = case.get("languages", list(case["input"]))
+        config.__dict__.update(case.get("settings", {}))
+        processor = types.SimpleNamespace(config=config, banned_words=self.banned_words)
+        written = FileProcessor.process_keywords(processor, {"MWG:Keywords": []}, case["input"])
+        reprocessed = FileProcessor.process_keywords(processor, {"MWG:Keywords": written or []}, case["input"])
+
+        return {"written": written, "reprocessed": reprocessed, "identical": written == reprocessed}
+
+    def cases(self, function):
+        return self.corpus.get("cases", {}).get(function, [])
+
+    def run(self, function, case, functions=None):
+        """ The output of one case as it is stored in the corpus. Errors
+            are part of the output.
+        """
+        try:
+            return json.loads(json.dumps((functions or self.functions)[function](case)))
+
+        except NoBaseline:
+            raise
+
+        except Exception as e:
+            return {"error": type(e).__name__}
+
+    def check(self, functions):
+        """ Return a list of the cases whose output is not the expected
+            one.
+        """
+        mismatches = []
+
+        for function in functions:
+            self.reset()
+
+            for case in self.cases(function):
+                actual = self.run(function, case)
+
+                if actual != case.get("expected"):
+                    mismatches.append({
+                        "function": function,
+                        "name": case.get("name", ""),
+                        "expected": case.get("expected"),
+                        "actual": actual,
+                    })
+
+        return mismatches
+
+    def corpus_words(self):
+        """ Every word in the corpus inputs, with case and plural variants.
+        """
+        words = set()
+
+        def add(value):
+            if isinstance(value, str):
+                words.update(re.split(r"[\s,]+", value))
+
+            elif isinstance(value, list):
+                for item in value:
+                    add(item)
+
+            elif isinstance(value, dict):
+                for item in value.values():
+                    add(item)
+
+        for function in ("de_pluralize", "normalize_keyword", "normalize_keywords", "mixed_keywords", "keywords_round_trip"):
+            for case in self.cases(function):
+                add(case["input"])
+
+        variants = set()
+
+        for word in words:
+            if word:
+                for variant in (word, word.lower(), word.upper(), word.capitalize()):
+                    variants.update((variant, variant + "s", variant + "es", variant + "ies"))
+
+        return sorted(variants)
+
+    def check_rules(self):
+        """ Compare the compiled de_pluralize rules with a plain scan of
+            the rule lists over every corpus word. Return the differences.
+        """
+        mismatches = []
+        _de_pluralize_cached.cache_clear()
+
+        for word in self.corpus_words():
+            expected = reference_de_pluralize(word)
+            actual = _de_pluralize_cached(word)
+
+            if actual != expected:
+                mismatches.append({"function": "de_pluralize_rules", "name": word, "expected": expected, "actual": actual})
+
+        return mismatches
+
+    def update(self, functions, baseline=None):
+        """ Record the expected outputs, from the baseline functions where
+            there are some and the current code otherwise. Return the
+            cases whose current output is not the baseline one and that
+            are not marked as intentional changes.
+        """
+        unexplained = []
+
+        for function in functions:
+            self.reset()
+
+            for case in self.cases(function):
+                current = self.run(function, case)
+
+                try:
+                    if not baseline or function not in baseline:
+                        raise NoBaseline
+
+                    expected = self.run(function, case, baseline)
+
+                except NoBaseline:
+                    case["expected"] = current
+
+                    continue
+
+                if "intentional_change" in case:
+                    case["expected"] = current
+                    case["intentional_change"]["baseline"] = expected
+
+                    continue
+
+                case["expected"] = expected
+
+                if current != expected:
+                    unexplained.append({"function": function, "name": case.get("name", ""), "expected": expected, "actual": current})
+
+        return unexplained
+
+    def time(self, function, min_time=0.2, rounds=5):
+        """ Time a function over all of its cases. Each round runs every
+            case at least once and until min_time has passed, and the
+            fastest round is reported.
+        """
+        cases = self.cases(function)
+
+        if not cases:
+            return None
+
+        size = sum(len(json.dumps(case["input"])) for case in cases)
+        best = None
+
+        for _ in range(rounds):
+            self.reset()
+            calls = 0
+            started = time.perf_counter()
+
+            while True:
+                for case in cases:
+                    self.run(function, case)
+
+                calls += len(cases)
+                elapsed = time.perf_counter() - started
+
+                if elapsed >= min_time:
+                    break
+
+                # Memos only help a cold pass once
+                self.reset()
+
+            per_call = elapsed / calls
+
+            if best is None or per_call < best:
+                best = per_call
+
+        return {
+            "function": function,
+            "cases": len(cases),
+            "microseconds_per_call": best * 1e6,
+            "calls_per_second": 1 / best if best else None,
+            "bytes_per_second": size / len(cases) / best if best else None,
+        }
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_corpus(corpus, path=CORPUS_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and time the keyword and JSON post-processing against a corpus of model answers"
+    )
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="Corpus file to use")
+    parser.add_argument("--only", nargs="+", metavar="FUNCTION", help="Only these functions")
+    parser.add_argument("--no-timing", action="store_true", help="Only check the outputs")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds to run each timing round for")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds per function, the fastest counts")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON to FILE, - for stdout")
+    parser.add_argument(
+        "--update", action="store_true",
+        help="Record the expected outputs. Only do this after checking the differences"
+    )
+    parser.add_argument(
+        "--baseline", metavar="REVISION",
+        help="With --update, record the outputs of the code at this git revision except for intentional changes"
+    )
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    bench = Bench(corpus)
+    functions = args.only or list(bench.functions)
+    unknown = [function for function in functions if function not in bench.functions]
+
+    if unknown:
+        parser.error(f"Unknown functions: {', '.join(unknown)}. Known: {', '.join(bench.functions)}")
+
+    if args.update:
+        baseline = None
+        directory = None
+
+        if args.baseline:
+            llmii, utils, directory = load_revision(args.baseline)
+            baseline = baseline_functions(llmii, utils, bench.banned_words)
+
+        try:
+            unexplained = bench.update(functions, baseline)
+
+        finally:
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        save_corpus(corpus, args.corpus)
+        print(f"Recorded expected outputs for {', '.join(functions)} in {args.corpus}")
+
+        for mismatch in unexplained:
+            print(f"CHANGED {mismatch['function']} {mismatch['name']}")
+            print(f"  baseline: {json.dumps(mismatch['expected'], ensure_ascii=False)[:300]}")
+            print(f"  current:  {json.dumps(mismatch['actual'], ensure_ascii=False)[:300]}")
+
+        if unexplained:
+            print(f"{len(unexplained)} cases differ from the baseline without an intentional_change")
+
+        return 1 if unexplained else 0
+
+    # Human readable output goes to stderr when the JSON goes to stdout
+    out = sys.stderr if args.json == "-" else sys.stdout
+    mismatches = bench.check(functions)
+    checked = sum(len(bench.cases(function)) for function in functions)
+
+    if "de_pluralize" in functions:
+        mismatches += bench.check_rules()
+        checked += len(bench.corpus_words())
+
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch['function']} {mismatch['name']}", file=out)
+        print(f"  expected: {json.dumps(mismatch['expected'], ensure_ascii=False)[:300]}", file=out)
+        print(f"  actual:   {json.dumps(mismatch['actual'], ensure_ascii=False)[:300]}", file=out)
+
+    print(f"{checked - len(mismatches)} of {checked} cases match", file=out)
+
+    timings = []
+
+    if not args.no_timing:
+        for function in functions:
+            timing = bench.time(function, args.min_time, args.rounds)
+
+            if timing:
+                timings.append(timing)
+                print(
+                    f"{function:20} {timing['cases']:5} cases {timing['microseconds_per_call']:10.1f} us/call "
+                    f"{timing['calls_per_second']:12.0f} calls/s {timing['bytes_per_second'] / 1e6:8.2f} MB/s",
+                    file=out
+                )
+
+    if args.json:
+        results = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": os.path.abspath(args.corpus),
+            "cases": checked,
+            "mismatches": mismatches,
+            "timings": timings,
+        }
+
+        if args.json == "-":
+            json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+            print()
+
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,8 @@ from PyQt6.QtGui import QPixmap, QImage, QPalette, QColor, QFont, QIcon
 
 
 from . import llmii
+from .progress import format_progress
+from .languages import available_languages, language_name
 from . import help_text
 
 class GuiConfig:
@@ -214,6 +216,8 @@ class SettingsDialog(QDialog):
         self.gen_count.setValue(250)
         gen_count_layout.addWidget(QLabel("GenTokens: "))
         gen_count_layout.addWidget(self.gen_count)
+        self.adaptive_tokens_checkbox = QCheckBox("Learn from the model")
+        gen_count_layout.addWidget(self.adaptive_tokens_checkbox)
         scroll_layout.addLayout(gen_count_layout)
         
         res_limit_layout = QHBoxLayout()
@@ -291,6 +295,21 @@ class SettingsDialog(QDialog):
         self.min_word_length_checkbox.setChecked(True)
         self.latin_only_checkbox = QCheckBox("Only Latin characters")
         self.latin_only_checkbox.setChecked(True)
+        self.keyword_language_layout = QHBoxLayout()
+        self.keyword_language_combo = QComboBox()
+
+        for code in available_languages():
+            self.keyword_language_combo.addItem(language_name(code), code)
+
+        self.keyword_language_combo.setCurrentIndex(self.keyword_language_combo.findData("fr"))
+        self.keyword_language_layout.addWidget(QLabel("Keyword language:"))
+        self.keyword_language_layout.addWidget(self.keyword_language_combo)
+        self.keyword_language_layout.addStretch(1)
+        self.languages_layout = QHBoxLayout()
+        self.languages_input = QLineEdit()
+        self.languages_input.setPlaceholderText("e.g. fr,en (empty for one language)")
+        self.languages_layout.addWidget(QLabel("Caption and keywords in:"))
+        self.languages_layout.addWidget(self.languages_input)
         
         corrections_layout.addWidget(self.depluralize_checkbox)
         corrections_layout.addLayout(self.word_limit_layout)
@@ -299,6 +318,8 @@ class SettingsDialog(QDialog):
         corrections_layout.addWidget(self.no_digits_start_checkbox)
         corrections_layout.addWidget(self.min_word_length_checkbox)
         corrections_layout.addWidget(self.latin_only_checkbox)
+        corrections_layout.addLayout(self.keyword_language_layout)
+        corrections_layout.addLayout(self.languages_layout)
         
         keyword_corrections_group.setLayout(corrections_layout)
         scroll_layout.addWidget(keyword_corrections_group)
@@ -343,6 +364,7 @@ class SettingsDialog(QDialog):
                 self.api_password_input.setText(settings.get('api_password', ''))
                 self.system_instruction_input.setText(settings.get('system_instruction', 'You are a helpful assistant.'))
                 self.gen_count.setValue(settings.get('gen_count', 250))
+                self.adaptive_tokens_checkbox.setChecked(settings.get('adaptive_tokens', False))
                 self.res_limit.setValue(settings.get('res_limit', 448))
                 self.instruction_text = settings.get('instruction', GuiConfig.DEFAULT_INSTRUCTION)
                 
@@ -377,7 +399,11 @@ class SettingsDialog(QDialog):
                 self.ban_prompt_words_checkbox.setChecked(settings.get('ban_prompt_words', True))
                 self.no_digits_start_checkbox.setChecked(settings.get('no_digits_start', True))
                 self.min_word_length_checkbox.setChecked(settings.get('min_word_length', True))
-                self.latin_only_checkbox.setChecked(settings.get('latin_only', True))    
+                self.latin_only_checkbox.setChecked(settings.get('latin_only', True))
+                self.keyword_language_combo.setCurrentIndex(
+                    max(0, self.keyword_language_combo.findData(settings.get('keyword_language', 'fr')))
+                )
+                self.languages_input.setText(settings.get('languages', ''))    
         
         except Exception as e:
             print(f"Error loading settings: {e}")
@@ -389,6 +415,7 @@ class SettingsDialog(QDialog):
             'system_instruction': self.system_instruction_input.text(),
             'instruction': self.instruction_text,
             'gen_count': self.gen_count.value(),
+            'adaptive_tokens': self.adaptive_tokens_checkbox.isChecked(),
             'res_limit': self.res_limit.value(),
             'no_crawl': self.no_crawl_checkbox.isChecked(),
             'reprocess_failed': self.reprocess_failed_checkbox.isChecked(),
@@ -413,6 +440,8 @@ class SettingsDialog(QDialog):
             'no_digits_start': self.no_digits_start_checkbox.isChecked(),
             'min_word_length': self.min_word_length_checkbox.isChecked(),
             'latin_only': self.latin_only_checkbox.isChecked(),
+            'keyword_language': self.keyword_language_combo.currentData(),
+            'languages': self.languages_input.text(),
         }
         
         try:
@@ -452,6 +481,7 @@ class APICheckThread(QThread):
 class IndexerThread(QThread):
     output_received = pyqtSignal(str)
     image_processed = pyqtSignal(str, str, list, str)  # base64_image, caption, keywords, filename
+    progress_updated = pyqtSignal(dict)
 
     def __init__(self, config):
         super().__init__()
@@ -469,6 +499,8 @@ class IndexerThread(QThread):
             keywords = message.get('keywords', [])
             file_path = message.get('file_path', '')
             self.image_processed.emit(base64_image, caption, keywords, file_path)
+        elif isinstance(message, dict) and message.get('type') == 'progress':
+            self.progress_updated.emit(message)
         else:
             # Regular text message for the log
             self.output_received.emit(str(message))
@@ -616,8 +648,11 @@ class ImageIndexerGUI(QMainWindow):
         settings_button = QPushButton("Settings")
         settings_button.clicked.connect(self.show_settings)
         self.api_status_label = QLabel("API Status: Checking...")
+        self.progress_label = QLabel("")
         settings_api_layout.addWidget(settings_button)
         settings_api_layout.addStretch(1)
+        settings_api_layout.addWidget(self.progress_label)
+        settings_api_layout.addStretch(1)
         settings_api_layout.addWidget(self.api_status_label)
         controls_layout.addLayout(settings_api_layout)
         
@@ -1010,6 +1045,14 @@ class ImageIndexerGUI(QMainWindow):
         config.no_digits_start = self.settings_dialog.no_digits_start_checkbox.isChecked()
         config.min_word_length = self.settings_dialog.min_word_length_checkbox.isChecked()
         config.latin_only = self.settings_dialog.latin_only_checkbox.isChecked()
+        config.keyword_language = self.settings_dialog.keyword_language_combo.currentData()
+        
+        try:
+            config.languages = llmii.parse_languages(self.settings_dialog.languages_input.text())
+        
+        except Exception as e:
+            self.output_area.append(f"Ignoring languages: {str(e)}")
+            config.languages = []
         
         # Load caption settings
         config.detailed_caption = self.settings_dialog.detailed_caption_radio.isChecked()
@@ -1023,10 +1066,12 @@ class ImageIndexerGUI(QMainWindow):
         config.update_keywords = self.settings_dialog.update_keywords_checkbox.isChecked()
         config.update_caption = self.settings_dialog.update_caption_checkbox.isChecked()
         config.gen_count = self.settings_dialog.gen_count.value()
+        config.adaptive_tokens = self.settings_dialog.adaptive_tokens_checkbox.isChecked()
         config.res_limit = self.settings_dialog.res_limit.value()     
         self.indexer_thread = IndexerThread(config)
         self.indexer_thread.output_received.connect(self.update_output)
         self.indexer_thread.image_processed.connect(self.update_image_preview)
+        self.indexer_thread.progress_updated.connect(self.update_progress)
         self.indexer_thread.finished.connect(self.indexer_finished)
         self.pause_handler.pause_signal.connect(self.set_paused)
         self.pause_handler.stop_signal.connect(self.set_stopped)
@@ -1070,6 +1115,9 @@ class ImageIndexerGUI(QMainWindow):
         self.stop_button.setEnabled(False)
         self.pause_button.setText("Pause")
 
+    def update_progress(self, progress):
+        self.progress_label.setText(format_progress(progress))
+
     def update_output(self, text):
         self.output_area.append(text)
         self.output_area.verticalScrollBar().setValue(self.output_area.verticalScrollBar().maximum())
@@ -1,5 +1,6 @@
 import json
 import re
+import functools
 
 AND_EXCEPTIONS= {
     'research and development',
@@ -117,6 +118,12 @@ AND_EXCEPTIONS= {
 class JsonFixError(Exception):
     pass
 
+_WHITESPACE = re.compile(r'\s')
+_DIGIT = re.compile(r'[0-9]')
+_CIRCULAR = re.compile(r'[Circular *\d]')
+_NUMBER_START = re.compile(r'[\-0-9]')
+_NUMBER_CHAR = re.compile(r'[\-\+eE0-9.]')
+
 def log(obj):
     if isinstance(obj, (int, float)):
         print(obj)
@@ -216,6 +223,297 @@ def json_matching(input, regex):
             return item
     return ""
 
+# Characters that matter when looking for the end of a JSON object
+_JSON_STRUCTURE = re.compile(r'[{}"\\]')
+
+def json_candidates(text):
+    """ Yield (start, end) for each top level {...} in text, found in
+        one pass. Braces inside double quoted strings are skipped. An
+        object still open at the end of the text is yielded last with
+        end set to None.
+    """
+    depth = 0
+    start = None
+    in_string = False
+    escaped = -1
+
+    for match in _JSON_STRUCTURE.finditer(text):
+        position = match.start()
+
+        if position == escaped:
+            continue
+
+        char = match.group()
+
+        if in_string:
+            if char == '\\':
+                escaped = position + 1
+
+            elif char == '"':
+                in_string = False
+
+            continue
+
+        if char == '"':
+            # Quotes in the text around an object are not strings
+            in_string = depth > 0
+
+        elif char == '{':
+            if depth == 0:
+                start = position
+
+            depth += 1
+
+        elif char == '}' and depth:
+            depth -= 1
+
+            if depth == 0:
+                yield start, position + 1
+
+    if depth:
+        yield start, None
+
+_NOT_WHITESPACE = re.compile(r'\S')
+
+def continues_json(text, more):
+    """ True if more carries on the JSON object that text was cut off
+        in, False if it is an answer started over. An object can only
+        be a value after a colon, so a { anywhere else before the open
+        object closes is the start of a new one. So is more opening with
+        a code fence, or with a { while text was cut inside a string.
+    """
+    depth = 0
+    in_string = False
+    escaped = -1
+    last = None
+    started = False
+
+    for match in _NOT_WHITESPACE.finditer(text + more):
+        position = match.start()
+        char = match.group()
+
+        if not started and position >= len(text):
+            started = True
+
+            if depth and (char == '`' or char == '{' and (in_string or last != ':')):
+                return False
+
+        if in_string:
+            if position == escaped:
+                continue
+
+            if char == '\\':
+                escaped = position + 1
+
+            elif char == '"':
+                in_string = False
+                last = char
+
+            continue
+
+        if char == '"':
+            # Quotes in the text around an object are not strings
+            in_string = depth > 0
+
+        elif char == '{':
+            if depth and last != ':' and position >= len(text):
+                return False
+
+            depth += 1
+
+        elif char == '}' and depth:
+            depth -= 1
+
+            if depth == 0 and position >= len(text):
+                return True
+
+        last = char
+
+    return True
+
+# What ends a run of plain characters inside a string
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+class IncrementalJsonParser:
+    """ Follows the first JSON object in text that arrives in chunks, as
+        from a streamed response. feed() takes each chunk as it comes and
+        keeps its state, so every character is looked at once however
+        the text is split.
+
+        progress() tells how far the answer has got: whether a
+        Description is complete and how many Keywords have been seen.
+        closed is set when a top level object holding an answer ends, so
+        the rest of the text can be skipped. Objects without one are
+        passed over. text() is the object so far, ready for
+        clean_json. Only double quoted strings are understood; anything
+        else is left for the repair done on the finished text.
+    """
+    def __init__(self):
+        self.parts = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string = []
+        # One entry per open container: [kind, path, current key, expecting key]
+        self.stack = []
+        self.values = {}
+        self.items = {}
+        self.closed = False
+
+    def feed(self, chunk):
+        """ Consume the next piece of text. Returns True once the top
+            level object has closed.
+        """
+        if self.closed or not chunk:
+            return self.closed
+
+        position = 0
+        length = len(chunk)
+        start = 0 if self.depth else None
+
+        while position < length:
+            if self.depth == 0:
+                position = chunk.find('{', position)
+
+                if position == -1:
+                    break
+
+                start = position
+
+            if self.escaped:
+                self.string.append(chunk[position])
+                self.escaped = False
+                position += 1
+
+                continue
+
+            if self.in_string:
+                match = _STRING_SPECIAL.search(chunk, position)
+                end = match.start() if match else length
+                self.string.append(chunk[position:end])
+
+                if not match:
+                    position = length
+
+                    break
+
+                position = end + 1
+
+                if match.group() == '\\':
+                    self.string.append('\\')
+                    self.escaped = True
+
+                else:
+                    self.in_string = False
+                    self._end_string()
+
+                continue
+
+            char = chunk[position]
+
+            # An object has to start with a key, so {this} or a { in a
+            # quoted phrase of the text around the answer is not one
+            if self.depth == 1 and self.stack[0][2] is None and not (char in '"}' or char.isspace()):
+                self.__init__()
+                start = None
+
+                continue
+
+            self._structure(char)
+            position += 1
+
+            if self.depth == 0:
+                if self.closed:
+                    self.parts.append(chunk[start:position])
+
+                    return True
+
+                # Braces in the text around the answer, like {this}
+                self.parts = []
+                start = None
+
+        if start is not None:
+            self.parts.append(chunk[start:])
+
+        return self.closed
+
+    def _structure(self, char):
+        top = self.stack[-1] if self.stack else None
+
+        if char == '"':
+            self.in_string = True
+            self.string = []
+
+        elif char in '{[':
+            path = top[1] + (top[2],) if top and top[0] == 'object' else top[1] if top else ()
+            self.stack.append(['object' if char == '{' else 'array', path, None, char == '{'])
+            self.depth += 1
+
+        elif char in '}]' and top:
+            self.stack.pop()
+            self.depth -= 1
+
+            if self.depth == 0:
+                self.closed = self.answered()
+
+                if not self.closed:
+                    self.__init__()
+
+            elif self.stack[-1][0] == 'array':
+                self._count_item(self.stack[-1])
+
+        elif top and top[0] == 'object':
+            if char == ':':
+                top[3] = False
+
+            elif char == ',':
+                top[3] = True
+
+    def _end_string(self):
+        top = self.stack[-1]
+        raw = ''.join(self.string)
+
+        try:
+            value = json.loads('"' + raw + '"')
+
+        except ValueError:
+            value = raw
+
+        if top[0] == 'array':
+            self._count_item(top)
+
+        elif top[3]:
+            top[2] = value
+
+        else:
+            self.values[top[1] + (top[2],)] = value
+
+    def _count_item(self, array):
+        self.items[array[1]] = self.items.get(array[1], 0) + 1
+
+    def text(self):
+        return ''.join(self.parts)
+
+    def answered(self):
+        """ True if the object so far holds an answer: a string
+            Description or at least one Keywords item. An object that
+            only shows the format, like {"Description": str}, does not.
+        """
+        progress = self.progress()
+
+        return progress["description"] or progress["keywords"] > 0
+
+    def progress(self):
+        """ A dict with closed, description (True once a Description
+            value is complete) and keywords (Keywords items seen so far,
+            summed over every language in a multi-language answer).
+        """
+        return {
+            "closed": self.closed,
+            "description": any(path[-1:] == ("Description",) for path in self.values),
+            "keywords": sum(count for path, count in self.items.items() if path[-1:] == ("Keywords",)),
+        }
+
 class JsonParser:
     def __init__(self, input):
         self.inspected = self.de_stringify(input)
@@ -224,16 +522,25 @@ class JsonParser:
 
     def reset_pointer(self):
         self.position = 0
-        self.quoted = ''
+        self.parts = []
         self.checkpoint = 0
-        self.checkpoint_quoted = ''
+        self.checkpoint_parts = 0
         self.quoted_last_comma_position = None
 
+    @property
+    def quoted(self):
+        # Output is collected in a list since growing one string a
+        # character at a time is quadratic
+        return ''.join(self.parts)
+
+    def emit(self, text):
+        self.parts.append(text)
+
     def set_checkpoint(self):
         if self.debug:
             print('setCheckpoint', self.position, self.inspected[self.position])
         self.checkpoint = self.position
-        self.checkpoint_quoted = self.quoted
+        self.checkpoint_parts = len(self.parts)
 
     def repair_json(self):
         self.reset_pointer()
@@ -254,10 +561,11 @@ class JsonParser:
         self.reset_pointer()
         recovery_position = 0
         while self.position < len(self.inspected):
-            self.quoted = ''
+            self.parts = []
+            self.quoted_last_comma_position = None
             self.eat_plain_text()
             result.append(self.quoted)
-            self.quoted = ''
+            self.parts = []
             if self.position >= len(self.inspected):
                 break
             if self.inspected[self.position] == '{':
@@ -266,7 +574,7 @@ class JsonParser:
                 try:
                     self.eat_object()
                 except Exception as e:
-                    self.quoted += '{'
+                    self.emit('{')
                     self.position = recovery_position
 
             result.append(self.quoted)
@@ -274,11 +582,13 @@ class JsonParser:
         return result
 
     def eat_plain_text(self):
-        while self.position < len(self.inspected) and self.inspected[self.position] != '{':
-            if self.debug:
-                print('eat_plain_text', self.position, self.inspected[self.position])
-            self.quoted += self.inspected[self.position]
-            self.position += 1
+        end = self.inspected.find('{', self.position)
+        if end == -1:
+            end = len(self.inspected)
+        if self.debug:
+            print('eat_plain_text', self.position, end)
+        self.emit(self.inspected[self.position:end])
+        self.position = end
 
     def eat_object(self):
         if self.debug:
@@ -311,7 +621,7 @@ class JsonParser:
             if self.inspected[self.position] == ',':
                 self.eat_comma()
             elif self.inspected[self.position] != '}':
-                self.quoted += ', '
+                self.emit(', ')
 
     def eat_reference_optional(self):
         if self.inspected[self.position] == '<':
@@ -351,8 +661,7 @@ class JsonParser:
         self.position += 1
 
     def eat_reference_number(self):
-        number_regex = re.compile(r'[0-9]')
-        while number_regex.match(self.inspected[self.position]):
+        while _DIGIT.match(self.inspected[self.position]):
             self.position += 1
 
     def eat_close_angle_bracket(self):
@@ -367,8 +676,7 @@ class JsonParser:
         return False
 
     def eat_whitespace(self):
-        whitespace_regex = re.compile(r'\s')
-        while whitespace_regex.match(self.inspected[self.position]):
+        while _WHITESPACE.match(self.inspected[self.position]):
             self.position += 1
 
     def eat_open_brace(self):
@@ -376,7 +684,7 @@ class JsonParser:
             print('eat_open_brace', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '{':
             raise JsonFixError('Expected open brace')
-        self.quoted += self.inspected[self.position] + ' '
+        self.emit(self.inspected[self.position] + ' ')
         self.position += 1
 
     def eat_close_brace(self):
@@ -384,7 +692,7 @@ class JsonParser:
             print('eat_close_brace', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '}':
             raise JsonFixError('Expected close brace')
-        self.quoted += ' ' + self.inspected[self.position]
+        self.emit(' ' + self.inspected[self.position])
         self.position += 1
 
     def eat_key(self):
@@ -450,14 +758,14 @@ class JsonParser:
         self.set_checkpoint()
         self.throw_if_json_special_character(self.inspected[self.position])
         quote = self.get_quote()
-        self.quoted += '"'
+        self.emit('"')
         self.position += 1
         self.eat_long_quote(quote)
         self.eat_extra_starting_key_double_quote(quote)
         while not self.check_quote(quote):
             self.eat_char_or_escaped_char(quote)
         self.log('eatQuotedKey end')
-        self.quoted += '"'
+        self.emit('"')
         self.position += 1
         self.eat_long_quote(quote)
 
@@ -468,13 +776,13 @@ class JsonParser:
         if self.inspected[self.position] == '[':
             return self.eat_null_key()
         self.throw_if_json_special_character(self.inspected[self.position])
-        self.quoted += '"'
+        self.emit('"')
         while self.inspected[self.position] != ':' and self.inspected[self.position] != ' ':
             if self.get_quote():
                 raise JsonFixError('Unexpected quote in unquoted key')
-            self.quoted += self.inspected[self.position]
+            self.emit(self.inspected[self.position])
             self.position += 1
-        self.quoted += '"'
+        self.emit('"')
 
     def eat_null_key(self):
         if self.debug:
@@ -497,7 +805,7 @@ class JsonParser:
         if self.inspected[self.position] != ']':
             raise JsonFixError('Expected close bracket')
         self.position += 1
-        self.quoted += '"null"'
+        self.emit('"null"')
 
     def throw_if_json_special_character(self, char):
         if char in ['{', '}', '[', ']', ':', ',']:
@@ -508,7 +816,7 @@ class JsonParser:
             print('eat_colon', self.position, self.inspected[self.position])
         if self.inspected[self.position] != ':':
             raise JsonFixError('Expected colon')
-        self.quoted += self.inspected[self.position] + ' '
+        self.emit(self.inspected[self.position] + ' ')
         self.position += 1
 
     def eat_value(self):
@@ -529,12 +837,12 @@ class JsonParser:
             print('eat_string', self.position, self.inspected[self.position])
         self.set_checkpoint()
         quote = self.get_quote()
-        self.quoted += '"'
+        self.emit('"')
         self.position += 1
         self.eat_long_quote(quote)
         while not self.is_end_quote_making_allowance_for_unescaped_single_quote(quote):
             self.eat_char_or_escaped_char(quote)
-        self.quoted += '"'
+        self.emit('"')
         self.position += 1
         self.eat_long_quote(quote)
 
@@ -547,14 +855,14 @@ class JsonParser:
 
         self.position = virtual_position + 1
         self.eat_whitespace()
-        self.quoted = self.quoted[:-1]
+        self.parts[-1] = self.parts[-1][:-1]
 
         quote = self.get_quote()
         self.position += 1
         self.eat_long_quote(quote)
         while not self.is_end_quote_making_allowance_for_unescaped_single_quote(quote):
             self.eat_char_or_escaped_char(quote)
-        self.quoted += '"'
+        self.emit('"')
         self.position += 1
         self.eat_long_quote(quote)
 
@@ -573,8 +881,7 @@ class JsonParser:
     def eat_virtual_whitespace(self, virtual_position):
         if virtual_position >= len(self.inspected):
             return virtual_position - 1
-        whitespace_regex = re.compile(r'\s')
-        while virtual_position < len(self.inspected) and whitespace_regex.match(self.inspected[virtual_position]):
+        while virtual_position < len(self.inspected) and _WHITESPACE.match(self.inspected[virtual_position]):
             virtual_position += 1
         return virtual_position
 
@@ -620,15 +927,15 @@ class JsonParser:
             if (quote == "'" or quote == '`') and self.inspected[self.position + 1] == quote:
                 pass
             else:
-                self.quoted += self.inspected[self.position]
+                self.emit(self.inspected[self.position])
             self.position += 1
         if (quote == "'" or quote == '`') and self.inspected[self.position] == '"':
-            self.quoted += '\\'
+            self.emit('\\')
         if (self.inspected[self.position] == '\n'):
-            self.quoted += '\\n'
+            self.emit('\\n')
             self.log('eatCharOrEscapedChar unescaped newline')
         else:
-            self.quoted += self.inspected[self.position]
+            self.emit(self.inspected[self.position])
         self.position += 1
 
     def eat_array(self):
@@ -636,7 +943,7 @@ class JsonParser:
             print('eat_array', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '[':
             raise JsonFixError('Expected array')
-        self.quoted += self.inspected[self.position]
+        self.emit(self.inspected[self.position])
         self.position += 1
 
         while True:
@@ -652,16 +959,13 @@ class JsonParser:
             if self.inspected[self.position] == ',':
                 self.eat_comma()
             elif self.inspected[self.position] != ']':
-                self.quoted += ', '
+                self.emit(', ')
 
         self.eat_close_bracket()
 
     def remove_trailing_comma_if_present(self):
-        if self.quoted_last_comma_position:
-            self.quoted = (
-                self.quoted[:self.quoted_last_comma_position] +
-                self.quoted[self.quoted_last_comma_position + 2:]
-            )
+        if self.quoted_last_comma_position is not None:
+            self.parts[self.quoted_last_comma_position] = ''
         self.quoted_last_comma_position = None
 
     def eat_circular_optional(self):
@@ -678,25 +982,24 @@ class JsonParser:
             self.eat_circular()
 
     def eat_circular(self):
-        test_regex = re.compile(r'[Circular *\d]')
-        while test_regex.match(self.inspected[self.position]):
+        while _CIRCULAR.match(self.inspected[self.position]):
             self.position += 1
-        self.quoted += '"Circular"'
+        self.emit('"Circular"')
 
     def eat_comma(self):
         if self.debug:
             print('eat_comma', self.position, self.inspected[self.position])
         if self.inspected[self.position] != ',':
             raise JsonFixError('Expected comma')
-        self.quoted += self.inspected[self.position] + ' '
-        self.quoted_last_comma_position = len(self.quoted) - 2
+        self.emit(self.inspected[self.position] + ' ')
+        self.quoted_last_comma_position = len(self.parts) - 1
         self.position += 1
         return True
 
     def eat_close_bracket(self):
         if self.inspected[self.position] != ']':
             raise JsonFixError('Expected close bracket')
-        self.quoted += self.inspected[self.position]
+        self.emit(self.inspected[self.position])
         self.position += 1
         return False
         
@@ -714,22 +1017,22 @@ class JsonParser:
             raise ValueError('Primitive not recognized, must start with f, t, n, or be numeric')
 
     def is_number_start_char(self, char):
-        return char and re.match(r'[\-0-9]', char)
+        return char and _NUMBER_START.match(char)
 
     def eat_keyword(self):
         lower_substring = self.inspected[self.position:self.position + 5].lower()
 
         if lower_substring.startswith('false'):
             self.log('eatFalse')
-            self.quoted += 'false'
+            self.emit('false')
             self.position += 5
         elif lower_substring.startswith('true'):
             self.log('eatTrue')
-            self.quoted += 'true'
+            self.emit('true')
             self.position += 4
         elif lower_substring.startswith('none') or lower_substring.startswith('null'):
             self.log('eatNull')
-            self.quoted += 'null'
+            self.emit('null')
             self.position += 4
         else:
             raise ValueError('Keyword not recognized, must be true, false, null or none')
@@ -764,10 +1067,10 @@ class JsonParser:
         if check_str.endswith('-') or check_str.endswith('+'):
             raise ValueError('Number cannot have trailing sign')
 
-        self.quoted += number_str
+        self.emit(number_str)
 
     def is_number_char(self, char):
-        return char and re.match(r'[\-\+eE0-9.]', char)
+        return char and _NUMBER_CHAR.match(char)
     
     def log(self, message):
         if self.debug:
@@ -1057,6 +1360,63 @@ plural_prepositions = [
     "with",
 ]
 
+def _literal_suffix(rule):
+    """ The literal text a $ anchored rule has to end with, or "" if
+        the rule is not anchored at the end.
+    """
+    if not rule.endswith("$"):
+        return ""
+    
+    suffix = ""
+    
+    for char in reversed(rule[:-1]):
+        if not char.isalpha():
+            break
+        
+        suffix = char + suffix
+    
+    return suffix.lower()
+
+class _RuleTable:
+    """ Rules indexed by the last character a match can end with, so a
+        word is only tried against rules that could match it. Order is
+        kept, so the first rule that matches is the same one as before.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.unanchored = [entry for entry in entries if not entry[-1]]
+        self.by_last_char = {}
+        
+        for entry in entries:
+            if entry[-1]:
+                char = entry[-1][-1]
+                self.by_last_char[char] = [
+                    other for other in entries if not other[-1] or other[-1].endswith(char)
+                ]
+    
+    def candidates(self, word):
+        # The index relies on lower() agreeing with IGNORECASE, which is
+        # only true for ASCII, and on $ matching only at the very end
+        if not word.isascii() or word.endswith("\n"):
+            return self.entries
+        
+        return self.by_last_char.get(word[-1:].lower(), self.unanchored)
+
+# Built once instead of on every call. Matching used IGNORECASE while
+# substitution used the rule as written, so both compiled forms are kept.
+_INVARIANT_WORDS = frozenset(singular_uninflected + singular_uncountable)
+_PREPOSITIONS = frozenset(plural_prepositions)
+_IE_SUFFIXES = tuple(word + "s" for word in singular_ie)
+
+_IRREGULAR = _RuleTable([
+    (re.compile(f"({plural})$", re.IGNORECASE), re.compile(f"(?i){plural}$"), singular_form, plural)
+    for plural, singular_form in singular_irregular.items()
+])
+_RULES = _RuleTable([
+    (re.compile(rule, re.IGNORECASE), re.compile(rule), replacement, _literal_suffix(rule))
+    for rule, replacement in singular_rules
+])
+
 def de_pluralize(word, custom={}):
     """ Convert a plural word to its singular form while preserving words 
         ending in double 's'.
@@ -1073,6 +1433,16 @@ def de_pluralize(word, custom={}):
         print(f"Warning: singular function received non-string input: {type(word)}")
         return str(word)
 
+    if custom:
+        return _de_pluralize(word, custom)
+    
+    return _de_pluralize_cached(word)
+
+@functools.lru_cache(maxsize=65536)
+def _de_pluralize_cached(word):
+    return _de_pluralize(word, {})
+
+def _de_pluralize(word, custom):
     if not word or word in custom:
         return custom.get(word, word)
 
@@ -1082,30 +1452,28 @@ def de_pluralize(word, custom={}):
     if word.endswith('ss'):
         return word
 
-    # Combine uninflected and uncountable words
-    invariant_words = set(singular_uninflected + singular_uncountable)
-    if lower_cased_word in invariant_words:
+    if lower_cased_word in _INVARIANT_WORDS:
         return word
 
     # Handle compound words
     if "-" in word:
         words = word.split("-")
-        if len(words) > 1 and words[1] in plural_prepositions:
+        if len(words) > 1 and words[1] in _PREPOSITIONS:
             return de_pluralize(words[0], custom) + "-" + "-".join(words[1:])
 
     # Check for words ending in '-ie'
-    if any(lower_cased_word.endswith(w + "s") for w in singular_ie):
+    if lower_cased_word.endswith(_IE_SUFFIXES):
         return word[:-1]
 
     # Check for irregular words
-    for plural, singular_form in singular_irregular.items():
-        if re.search(f"({plural})$", word, re.IGNORECASE):
-            return re.sub(f"(?i){plural}$", singular_form, word)
+    for search, sub, singular_form, _ in _IRREGULAR.candidates(word):
+        if search.search(word):
+            return sub.sub(singular_form, word)
 
     # Apply rules
-    for rule, replacement in singular_rules:
-        if re.search(rule, word, re.IGNORECASE):
-            return re.sub(rule, replacement, word)
+    for search, sub, replacement, _ in _RULES.candidates(word):
+        if search.search(word):
+            return sub.sub(replacement, word)
 
     # If no rules apply, return the original word
     return word
@@ -0,0 +1,223 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from .config import RESOURCES_DIR
+
+MANIFEST_DIR = os.path.join(RESOURCES_DIR, "manifests")
+MANIFEST_VERSION = 1
+
+
+class DirectoryManifest:
+    """ Remembers, per directory, the mtime it had when every image in it
+        was known to be finished along with its subdirectories. On the
+        next run a directory whose mtime has not changed does not need
+        to be listed or have its metadata read again.
+
+        Adding, removing or renaming an entry changes a directory's
+        mtime, so unchanged means no image was added since. The manifest
+        is kept in the resources directory rather than in the tree so
+        saving it does not itself change the root directory's mtime.
+    """
+    def __init__(self, root_dirs, extension_map, enabled=True, rules=""):
+        if isinstance(root_dirs, str):
+            root_dirs = [root_dirs]
+
+        self.root_dir = root_dirs[0]
+
+        # Each set of roots and each set of ignore rules finds different
+        # files, so they get their own manifest
+        key = "\0".join(sorted(os.path.abspath(root_dir) for root_dir in root_dirs))
+        key += "\0" + rules if rules else ""
+        root_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        self.path = os.path.join(MANIFEST_DIR, root_hash + ".json")
+        self.extension_map = extension_map
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.directories = {}
+        self.in_progress = {}
+        self.directories_skipped = 0
+        self.changed = False
+        self.load()
+
+    def _key(self, directory):
+        try:
+            return os.path.relpath(directory, self.root_dir)
+
+        except ValueError:
+            # Another drive on Windows
+            return os.path.abspath(directory)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if data.get("version") == MANIFEST_VERSION:
+                self.directories = data.get("directories", {})
+
+        except (OSError, ValueError):
+            self.directories = {}
+
+    def save(self):
+        """ Write the manifest atomically if anything changed.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+
+            data = json.dumps({"version": MANIFEST_VERSION, "directories": self.directories})
+            self.changed = False
+
+        try:
+            os.makedirs(MANIFEST_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=".llmii-", suffix=".json", dir=MANIFEST_DIR)
+
+        except OSError as e:
+            print(f"Could not save directory manifest: {str(e)}")
+
+            return
+
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+
+            os.replace(temp_path, self.path)
+
+        except OSError as e:
+            print(f"Could not save directory manifest: {str(e)}")
+
+            try:
+                os.remove(temp_path)
+
+            except OSError:
+                pass
+
+    def unchanged_subdirectories(self, directory):
+        """ If the directory is finished and its mtime is unchanged,
+            return the full paths of its subdirectories so the walk can
+            continue without listing it. Otherwise return None.
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.directories.get(self._key(directory))
+
+        if not entry or not entry.get("done"):
+            return None
+
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+
+        except OSError:
+            return None
+
+        if mtime != entry.get("mtime"):
+            return None
+
+        with self.lock:
+            self.directories_skipped += 1
+
+        return [os.path.join(directory, name) for name in entry.get("subdirs", [])]
+
+    def begin_listing(self, directory):
+        """ Called before a directory is listed.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+
+        except OSError:
+            mtime = None
+
+        with self.lock:
+            self.in_progress[directory] = {
+                "mtime": mtime,
+                "pending": 0,
+                "listing": True,
+                "finished": True,
+                "images": 0,
+                "subdirs": [],
+            }
+
+    def chunk_queued(self, directory, count):
+        with self.lock:
+            state = self.in_progress.get(directory)
+
+            if state:
+                state["pending"] += count
+                state["images"] += count
+
+    def end_listing(self, directory, subdirectories, complete=True, ignored=0):
+        with self.lock:
+            state = self.in_progress.get(directory)
+
+            if not state:
+                return
+
+            state["listing"] = False
+            state["ignored"] = ignored
+            state["finished"] = state["finished"] and complete
+            state["subdirs"] = [os.path.basename(path) for path in subdirectories]
+
+        self._finish_if_done(directory)
+
+    def chunk_finished(self, directory, count, all_finished):
+        """ Called by the processor after a chunk of count files.
+            all_finished says whether every file in the chunk now has a
+            final status. Files are counted rather than chunks since the
+            scheduler may regroup them.
+        """
+        with self.lock:
+            state = self.in_progress.get(directory)
+
+            if not state:
+                return
+
+            state["pending"] -= count
+            state["finished"] = state["finished"] and all_finished
+
+        self._finish_if_done(directory)
+
+    def _count_images(self, directory):
+        count = 0
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                dot = entry.name.rfind(".")
+
+                if dot != -1 and entry.name[dot:].lower() in self.extension_map and entry.is_file():
+                    count += 1
+
+        return count
+
+    def _finish_if_done(self, directory):
+        with self.lock:
+            state = self.in_progress.get(directory)
+
+            if not state or state["listing"] or state["pending"] > 0:
+                return
+
+            del self.in_progress[directory]
+
+        done = state["finished"]
+        mtime = state["mtime"]
+
+        # Our own writes replace files and so move the directory mtime.
+        # Take the new mtime, but only if no image appeared meanwhile.
+        if done and state["images"]:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                done = self._count_images(directory) == state["images"] + state["ignored"]
+
+            except OSError:
+                done = False
+
+        with self.lock:
+            self.directories[self._key(directory)] = {
+                "mtime": mtime,
+                "subdirs": state["subdirs"],
+                "done": done,
+            }
+            self.changed = True
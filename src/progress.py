@@ -0,0 +1,233 @@
+import time
+import threading
+
+STAGES = ["read", "decode", "inference", "write"]
+
+
+def format_duration(seconds):
+    """ Format seconds as 42s, 7m 03s or 2h 05m. None is unknown.
+    """
+    if seconds is None:
+        return "unknown"
+
+    seconds = int(round(max(0, seconds)))
+
+    if seconds < 60:
+        return f"{seconds}s"
+
+    minutes, seconds = divmod(seconds, 60)
+
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}h {minutes:02d}m"
+
+def format_progress(progress):
+    """ One line summary of a progress dict from ProgressTracker.
+    """
+    crawl = "" if progress["crawl_complete"] else ", still crawling"
+    eta = format_duration(progress["eta_seconds"])
+
+    if progress["eta_lower_bound"] and progress["eta_seconds"] is not None:
+        eta = "at least " + eta
+
+    notes = ""
+
+    if progress.get("retries"):
+        reasons = ", ".join(f"{count} {reason}" for reason, count in progress.get("retry_reasons", {}).items())
+        notes = f" Retried {progress['retries']}" + (f" ({reasons})" if reasons else "") + "."
+
+    if progress.get("continuations") or progress.get("salvaged"):
+        notes += f" Continued {progress['continuations']} cut off answers, salvaged {progress['salvaged']}."
+
+    if progress.get("token_budgets"):
+        budgets = ", ".join(f"{task} {tokens}" for task, tokens in progress["token_budgets"].items())
+        notes += f" Token budgets: {budgets}."
+
+    return (
+        f"Processed {progress['processed']}, skipped {progress['skipped']}, "
+        f"failed {progress['failed']} of {progress['found']} found{crawl}. "
+        f"Remaining {progress['remaining']}, time remaining (est): {eta}{notes}"
+    )
+
+
+class ProgressTracker:
+    """ Keeps the counts and timings behind the progress report and ETA.
+
+        Each stage of the work (reading metadata, decoding, inference and
+        writing) has an exponentially weighted moving average of seconds
+        per file for each file type, so the estimate follows the current
+        speed and a folder of RAWs is not priced like one of JPEGs.
+
+        Files that turn out to need no work are counted separately and
+        only cost their read time. The share of them seen so far for each
+        type is applied to the files still waiting. While the crawl is
+        running the files it has not found yet are unknown, so the ETA
+        is marked as a lower bound.
+    """
+    def __init__(self, extension_map, alpha=0.2):
+        self.extension_map = extension_map
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+        self.found_by_type = {}
+        self.done_by_type = {}
+        self.skipped_by_type = {}
+        self.stage_seconds = {}
+        self.stage_seconds_all = {}
+
+        self.processed = 0
+        self.skipped = 0
+        self.reused = 0
+        self.failed = 0
+        self.retries = 0
+        self.retry_reasons = {}
+        self.continuations = 0
+        self.salvaged = 0
+
+    def file_type(self, file_path):
+        dot = file_path.rfind(".")
+
+        return self.extension_map.get(file_path[dot:].lower()) if dot != -1 else None
+
+    def found(self, files):
+        """ Called when files are put on the queue.
+        """
+        with self.lock:
+            for file_path in files:
+                file_type = self.file_type(file_path)
+                self.found_by_type[file_type] = self.found_by_type.get(file_type, 0) + 1
+
+    def _average(self, table, key, seconds):
+        previous = table.get(key)
+        table[key] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def timed(self, stage, file_type, seconds, count=1):
+        """ Record that a stage took seconds for count files.
+        """
+        if count <= 0:
+            return
+
+        with self.lock:
+            self._average(self.stage_seconds, (stage, file_type), seconds / count)
+            self._average(self.stage_seconds_all, stage, seconds / count)
+
+    def retry(self, reason=None):
+        with self.lock:
+            self.retries += 1
+
+            if reason:
+                self.retry_reasons[reason] = self.retry_reasons.get(reason, 0) + 1
+
+    def truncated(self, continuations, salvaged):
+        """ Count an answer cut off by the token limit that was used
+            anyway, after continuations extra requests. salvaged means
+            it was still incomplete and only the keywords that made it
+            were kept.
+        """
+        with self.lock:
+            self.continuations += continuations
+
+            if salvaged:
+                self.salvaged += 1
+
+    def finished(self, file_path, outcome):
+        """ Count a file that needs nothing more this run. outcome is
+            "processed", "skipped", "reused" or "failed".
+        """
+        file_type = self.file_type(file_path)
+
+        with self.lock:
+            self.done_by_type[file_type] = self.done_by_type.get(file_type, 0) + 1
+
+            if outcome in ("skipped", "reused"):
+                self.skipped_by_type[file_type] = self.skipped_by_type.get(file_type, 0) + 1
+
+            if outcome == "processed":
+                self.processed += 1
+
+            elif outcome == "skipped":
+                self.skipped += 1
+
+            elif outcome == "reused":
+                self.reused += 1
+
+            else:
+                self.failed += 1
+
+    def _seconds_per_file(self, stage, file_type):
+        seconds = self.stage_seconds.get((stage, file_type))
+
+        if seconds is None:
+            seconds = self.stage_seconds_all.get(stage)
+
+        return seconds
+
+    def estimate(self, file_type):
+        """ Seconds a file of this type is expected to take to process,
+            or 0 if none has been timed yet.
+        """
+        with self.lock:
+            return sum(self._seconds_per_file(stage, file_type) or 0 for stage in STAGES[1:])
+
+    def snapshot(self, crawl_complete=True):
+        """ Return the progress as a dict for the CLI, the GUI or JSON.
+        """
+        with self.lock:
+            found = sum(self.found_by_type.values())
+            done = sum(self.done_by_type.values())
+            skipped_total = sum(self.skipped_by_type.values())
+            eta = 0.0
+            known = True
+
+            for file_type, count in self.found_by_type.items():
+                remaining = count - self.done_by_type.get(file_type, 0)
+
+                if remaining <= 0:
+                    continue
+
+                done_of_type = self.done_by_type.get(file_type, 0)
+
+                if done_of_type:
+                    work_share = 1 - self.skipped_by_type.get(file_type, 0) / done_of_type
+
+                elif done:
+                    work_share = 1 - skipped_total / done
+
+                else:
+                    work_share = 1.0
+
+                read = self._seconds_per_file("read", file_type) or 0
+                work = [self._seconds_per_file(stage, file_type) for stage in STAGES[1:]]
+
+                if work_share > 0 and work[1] is None:
+                    known = False
+
+                    break
+
+                eta += remaining * (read + work_share * sum(seconds or 0 for seconds in work))
+
+            per_file = sum(self.stage_seconds_all.get(stage, 0) for stage in STAGES[1:])
+
+            return {
+                "type": "progress",
+                "found": found,
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "reused": self.reused,
+                "failed": self.failed,
+                "retries": self.retries,
+                "retry_reasons": dict(self.retry_reasons),
+                "continuations": self.continuations,
+                "salvaged": self.salvaged,
+                "remaining": max(0, found - done),
+                "crawl_complete": crawl_complete,
+                "eta_seconds": eta if known else None,
+                "eta_lower_bound": not crawl_complete,
+                "files_per_hour": 3600 / per_file if per_file else None,
+                "elapsed_seconds": time.monotonic() - self.started,
+                "stage_seconds": dict(self.stage_seconds_all),
+            }
@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import exiftool
+from .keywords import normalize_mixed_keywords
+from .languages import available_languages
+
+
+class Renormalizer:
+    """ Applies the current keyword rules to keywords already written,
+        without running the model. Use it after changing the word limit,
+        latin_only, the banned words or depluralization.
+
+        Files come from the same crawl as a normal run, so roots,
+        --files-from and ignore rules all apply. Several workers each
+        read a chunk with their own ExifTool process, renormalize and
+        only write the files whose keywords changed. Only files with an
+        Identifier are touched, so keywords entered by hand on images
+        the indexer never processed are left alone.
+
+        A file written with --languages can hold keywords in several
+        languages. Its languages are the ones given with --languages, or
+        otherwise keyword_language plus those of its language alternative
+        captions, and each keyword goes through the rules of the first of
+        them, caption language first, that recognizes it.
+    """
+    def __init__(self, file_processor, workers=4):
+        self.processor = file_processor
+        self.config = file_processor.config
+        self.callback = file_processor.callback
+        self.workers = max(1, int(workers))
+        self.lock = threading.Lock()
+        self.changed = 0
+        self.unchanged = 0
+        self.not_processed = 0
+        self.emptied = 0
+        self.errors = 0
+        self.language_fields = {f"XMP:Description-{code}": code for code in available_languages()}
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+
+        finally:
+            self.processor.finish()
+
+        verb = "Would change" if self.config.dry_run else "Changed"
+        self.callback(
+            f"Renormalize complete. {verb} {self.changed} files, {self.unchanged} unchanged, "
+            f"{self.not_processed} not processed by the indexer, {self.emptied} left alone because no keyword "
+            f"survived, {self.errors} errors"
+        )
+
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _worker(self):
+        processor = self.processor
+        metadata_queue = processor.metadata_queue
+
+        with exiftool.ExifToolHelper(encoding='utf-8') as et:
+            while not (processor.indexer.indexing_complete and metadata_queue.empty()):
+                if processor.check_pause_stop():
+                    return
+
+                try:
+                    directory, files = metadata_queue.get(timeout=1)
+
+                except queue.Empty:
+                    continue
+
+                self._renormalize_chunk(et, files)
+
+    def _read_keywords(self, et, files):
+        """ Return (file, keywords, has identifier, languages) for each
+            file that ExifTool could read.
+        """
+        processor = self.processor
+        fields = processor.keyword_fields + processor.identifier_fields + list(self.language_fields)
+        paths = {processor._metadata_path(file_path): file_path for file_path in files}
+
+        try:
+            results = et.get_tags(list(paths), tags=fields)
+
+        except Exception as e:
+            self.callback(f"ExifTool error reading {len(files)} files: {str(e)}")
+
+            for _ in files:
+                self._count("errors")
+
+            return []
+
+        read = []
+
+        for metadata in results:
+            file_path = paths.get(metadata.get("SourceFile"), metadata.get("SourceFile"))
+            keywords = []
+            identifier = None
+            languages = [self.config.keyword_language]
+
+            for key, value in metadata.items():
+                if key in processor.keyword_fields:
+                    keywords.extend(value if isinstance(value, list) else [value])
+
+                if key in processor.identifier_fields:
+                    identifier = value
+
+                if key in self.language_fields and value:
+                    languages.append(self.language_fields[key])
+
+            read.append((file_path, keywords, bool(identifier), self.config.languages or languages))
+
+        return read
+
+    def _renormalize_chunk(self, et, files):
+        processor = self.processor
+
+        for file_path, keywords, has_identifier, languages in self._read_keywords(et, files):
+            if not has_identifier:
+                self._count("not_processed")
+
+                continue
+
+            if not keywords:
+                self._count("unchanged")
+
+                continue
+
+            keywords = [str(keyword) for keyword in keywords]
+            renormalized = normalize_mixed_keywords(keywords, processor.banned_words, self.config, languages)
+
+            # Never strip every keyword from a file
+            if not renormalized:
+                self._count("emptied")
+
+                continue
+
+            # Keywords are compared as a set like write_metadata does
+            if set(renormalized) == set(keywords):
+                self._count("unchanged")
+
+                continue
+
+            metadata = {"SourceFile": file_path, "MWG:Keywords": renormalized}
+
+            if processor.write_metadata(file_path, metadata, {"MWG:Keywords": keywords}, et=et):
+                self._count("changed")
+
+                if self.config.dry_run:
+                    self.callback(f"{os.path.basename(file_path)}: {', '.join(renormalized)}")
+
+            else:
+                self._count("errors")
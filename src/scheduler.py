@@ -0,0 +1,184 @@
+import os
+import heapq
+import queue
+import itertools
+import collections
+
+SCHEDULE_POLICIES = ["crawl", "newest", "smallest", "format", "shortest", "round-robin"]
+
+
+class WorkScheduler:
+    """ Decides the order files are processed in.
+
+        The crawl fills a bounded window of files and the scheduler hands
+        back chunks from it according to the policy:
+
+            crawl        - directory by directory as found (the default)
+            newest       - most recently modified first
+            smallest     - smallest files first for fast feedback
+            format       - one file type at a time, so RAWs stay together
+            shortest     - file type with the lowest average processing
+                           time so far first
+            round-robin  - alternate between the top level folders
+
+        Only the files in the window are reordered, so memory stays flat
+        however large the backlog is. A chunk only ever holds files from
+        one directory, so the next batch_size files in policy order are
+        grouped by directory and handed out a group at a time. Policies
+        that interleave directories still get chunks of many files.
+    """
+    def __init__(self, policy, source_queue, extension_map, root_dirs,
+                 batch_size=250, window=2000, estimate=None):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"Unknown schedule policy: {policy}")
+
+        self.policy = policy
+        self.source_queue = source_queue
+        self.extension_map = extension_map
+        self.root_dirs = [os.path.normpath(root_dir) for root_dir in root_dirs or []]
+        self.batch_size = max(1, int(batch_size))
+        self.window = max(self.batch_size, int(window))
+        self.estimate = estimate or (lambda file_type: 0)
+
+        # bucket -> heap of (key, sequence, directory, file)
+        self.buckets = {}
+        self.bucket_order = []
+        self.current_bucket = None
+        self.size = 0
+        self.sequence = itertools.count()
+
+        # Groups of the last batch not handed out yet
+        self.pending = collections.deque()
+
+    def empty(self):
+        return self.size == 0 and not self.pending
+
+    def get(self, timeout=1):
+        """ Return the next (directory, files) chunk. Raises queue.Empty
+            if nothing arrived within timeout.
+        """
+        if self.policy == "crawl":
+            return self.source_queue.get(timeout=timeout)
+
+        if self.pending:
+            return self.pending.popleft()
+
+        self._fill(block=self.size == 0, timeout=timeout)
+
+        if self.size == 0:
+            raise queue.Empty
+
+        return self._take(self._choose_bucket())
+
+    def _fill(self, block, timeout):
+        """ Top the window up from the crawl queue without waiting,
+            unless the window is empty.
+        """
+        while self.size < self.window:
+            try:
+                directory, files = self.source_queue.get(block=block, timeout=timeout if block else None)
+
+            except queue.Empty:
+                return
+
+            block = False
+
+            for file_path in files:
+                self._add(directory, file_path)
+
+    def _file_type(self, file_path):
+        dot = file_path.rfind(".")
+
+        return self.extension_map.get(file_path[dot:].lower()) if dot != -1 else None
+
+    def _top_folder(self, directory):
+        """ The root directory and first folder below it that directory
+            is in. Files from a path list outside every root are grouped
+            by their own directory.
+        """
+        for root_dir in self.root_dirs:
+            if directory == root_dir or directory.startswith(root_dir.rstrip(os.sep) + os.sep):
+                relative = os.path.relpath(directory, root_dir)
+
+                return root_dir, relative.split(os.sep, 1)[0]
+
+        return directory, ""
+
+    def _sort_key(self, file_path):
+        if self.policy not in ("newest", "smallest"):
+            return 0
+
+        try:
+            stat = os.stat(file_path)
+
+        except OSError:
+            return 0
+
+        if self.policy == "newest":
+            return -stat.st_mtime_ns
+
+        return stat.st_size
+
+    def _add(self, directory, file_path):
+        if self.policy in ("format", "shortest"):
+            bucket = self._file_type(file_path)
+
+        elif self.policy == "round-robin":
+            bucket = self._top_folder(directory)
+
+        else:
+            bucket = None
+
+        if bucket not in self.buckets:
+            self.buckets[bucket] = []
+            self.bucket_order.append(bucket)
+
+        entry = (self._sort_key(file_path), next(self.sequence), directory, file_path)
+        heapq.heappush(self.buckets[bucket], entry)
+        self.size += 1
+
+    def _choose_bucket(self):
+        if self.policy == "format":
+            # Stay with the current type until it runs out, then
+            # move to the type with the most files waiting
+            if self.current_bucket not in self.buckets:
+                self.current_bucket = max(self.bucket_order, key=lambda bucket: len(self.buckets[bucket]))
+
+            return self.current_bucket
+
+        if self.policy == "shortest":
+            # Types never seen estimate as 0 so each gets sampled early
+            return min(self.bucket_order, key=lambda bucket: self.estimate(bucket))
+
+        if self.policy == "round-robin":
+            bucket = self.bucket_order.pop(0)
+            self.bucket_order.append(bucket)
+
+            return bucket
+
+        return self.bucket_order[0]
+
+    def _take(self, bucket):
+        """ Pop up to batch_size files from a bucket in order and group
+            them by directory. Return the first group and keep the rest
+            for the next calls.
+        """
+        heap = self.buckets[bucket]
+        groups = {}
+        taken = 0
+
+        while heap and taken < self.batch_size:
+            _, _, directory, file_path = heapq.heappop(heap)
+            groups.setdefault(directory, []).append(file_path)
+            taken += 1
+
+        self.size -= taken
+
+        if not heap:
+            del self.buckets[bucket]
+            self.bucket_order.remove(bucket)
+
+        chunks = list(groups.items())
+        self.pending.extend(chunks[1:])
+
+        return chunks[0]
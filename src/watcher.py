@@ -0,0 +1,270 @@
+import os
+import time
+import threading
+import collections
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.dest_path)
+
+
+class DirectoryWatcher(threading.Thread):
+    """ Watches the tree for new or modified images and puts them on
+        watch_queue as (directory, files) chunks once they have settled.
+
+        Uses inotify (or the platform equivalent) through watchdog when it
+        is installed, otherwise polls directory mtimes. A file is only
+        handed over when its size and mtime have not changed for
+        settle_seconds, so files still being copied are left alone.
+
+        Writing metadata replaces the file, which looks like a new
+        arrival. Files this process wrote are reported with wrote() and
+        ignored for as long as they are exactly as the write left them,
+        for up to written_seconds and the last max_written writes.
+    """
+    def __init__(self, root_dirs, watch_queue, extension_map, no_crawl=False,
+                 settle_seconds=5, poll_interval=2, ignore=None, written_seconds=3600, max_written=10000):
+        threading.Thread.__init__(self, daemon=True)
+
+        if isinstance(root_dirs, str):
+            root_dirs = [root_dirs]
+
+        self.root_dirs = list(root_dirs)
+        self.normalized_roots = {os.path.normpath(root_dir) for root_dir in self.root_dirs}
+        self.watch_queue = watch_queue
+        self.extension_map = extension_map
+        self.no_crawl = no_crawl
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.ignore = ignore
+        self.written_seconds = written_seconds
+        self.max_written = max_written
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+        # path -> (size, mtime_ns, time the signature last changed)
+        self.candidates = {}
+
+        # path -> (size, mtime_ns) right after we wrote it, time written,
+        # oldest write first
+        self.written = collections.OrderedDict()
+
+        # directory -> (mtime_ns, time listed, subdirectories) for polling
+        self.directory_mtimes = {}
+        self.files_found = 0
+        self.mode = "inotify" if Observer is not None else "polling"
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _is_image(self, path):
+        dot = path.rfind(".")
+
+        return dot != -1 and path[dot:].lower() in self.extension_map
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+
+        except OSError:
+            return None
+
+        return stat.st_size, stat.st_mtime_ns
+
+    def wrote(self, path):
+        """ Note that this process just wrote metadata to path.
+        """
+        signature = self._signature(path)
+
+        if signature is not None:
+            path = os.path.normpath(path)
+
+            with self.lock:
+                self.written[path] = (signature, time.monotonic())
+                self.written.move_to_end(path)
+
+                while len(self.written) > self.max_written:
+                    self.written.popitem(last=False)
+
+    def _ours(self, path, signature):
+        """ True if path is as our last write left it. Called with the
+            lock held. Once the file changed again it is not ours.
+        """
+        path = os.path.normpath(path)
+        written = self.written.get(path)
+
+        if written is None:
+            return False
+
+        if written[0] != signature:
+            del self.written[path]
+
+            return False
+
+        return True
+
+    def _expire_written(self, now):
+        # Oldest first, so stop at the first write that is recent enough
+        while self.written:
+            path, (signature, written_at) = next(iter(self.written.items()))
+
+            if now - written_at <= self.written_seconds:
+                break
+
+            del self.written[path]
+
+    def touch(self, path):
+        """ Note that a file was created or changed. It becomes a
+            candidate and its settle timer restarts.
+        """
+        if not self._is_image(path):
+            return
+
+        if self.no_crawl and os.path.dirname(path) not in self.normalized_roots:
+            return
+
+        if self.ignore and self.ignore.ignored_path(path, count=False):
+            return
+
+        signature = self._signature(path)
+
+        if signature is None:
+            return
+
+        with self.lock:
+            if self._ours(path, signature):
+                return
+
+            previous = self.candidates.get(path)
+
+            if previous is None or previous[:2] != signature:
+                self.candidates[path] = signature + (time.monotonic(),)
+
+    def run(self):
+        observer = None
+
+        if Observer is not None:
+            observer = Observer()
+
+            for root_dir in self.root_dirs:
+                observer.schedule(_EventHandler(self), root_dir, recursive=not self.no_crawl)
+
+            observer.start()
+
+        else:
+            # Remember what is there now so only new arrivals count
+            self._scan_directories(initial=True)
+
+        try:
+            while not self.stop_event.wait(min(self.poll_interval, self.settle_seconds)):
+                if observer is None:
+                    self._scan_directories()
+
+                self._release_settled()
+
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def _scan_directories(self, initial=False):
+        """ Polling fallback. A directory is only listed again when its
+            mtime changed, which is what happens when files are added or
+            renamed into it. Of those files only the ones whose ctime is
+            after our last look at the directory are new arrivals.
+        """
+        pending = list(self.root_dirs)
+
+        while pending and not self.stop_event.is_set():
+            directory = pending.pop()
+            scan_time = time.time_ns()
+
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                previous = self.directory_mtimes.get(directory)
+
+                if previous and previous[0] == mtime:
+                    pending.extend(previous[2])
+
+                    continue
+
+                subdirectories = []
+                last_scan = previous[1] if previous else 0
+
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.no_crawl:
+                                subdirectories.append(entry.path)
+
+                        elif not initial and self._is_image(entry.name) and entry.is_file():
+                            if entry.stat().st_ctime_ns >= last_scan:
+                                self.touch(entry.path)
+
+                self.directory_mtimes[directory] = (mtime, scan_time, subdirectories)
+                pending.extend(subdirectories)
+
+            except OSError:
+                continue
+
+    def _release_settled(self):
+        now = time.monotonic()
+        settled = {}
+
+        with self.lock:
+            self._expire_written(now)
+            due = [
+                (path, candidate) for path, candidate in self.candidates.items()
+                if now - candidate[2] >= self.settle_seconds
+            ]
+
+        # Stat outside the lock so events keep coming in meanwhile
+        signatures = [(path, candidate, self._signature(path)) for path, candidate in due]
+
+        with self.lock:
+            for path, candidate, signature in signatures:
+                size, mtime, changed_at = candidate
+
+                # An event came in while we were looking
+                if self.candidates.get(path) != candidate:
+                    continue
+
+                if signature is None:
+                    del self.candidates[path]
+
+                elif signature != (size, mtime):
+                    self.candidates[path] = signature + (now,)
+
+                # The event for our own write came before wrote()
+                elif self._ours(path, signature):
+                    del self.candidates[path]
+
+                else:
+                    del self.candidates[path]
+                    settled.setdefault(os.path.dirname(path), []).append(path)
+
+        for directory, files in settled.items():
+            self.files_found += len(files)
+            self.watch_queue.put((directory, files))
@@ -0,0 +1,310 @@
+import io
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+
+# Formats where the XMP packet is stored as plain text and is
+# usually near the start of the file
+SNIFF_EXTENSIONS = {
+    ".jpg", ".jpeg", ".jpe", ".jif", ".jfif", ".jfi",
+    ".png",
+    ".tif", ".tiff",
+    ".webp",
+    ".xmp",
+}
+
+SNIFF_BYTES = 512 * 1024
+
+XMP_START = re.compile(rb"<x(?:ap)?:xmpmeta\b")
+XMP_END = re.compile(rb"</x(?:ap)?:xmpmeta>")
+
+# Only the properties this tool writes, dc:identifier and mediapro:Status,
+# so xmpMM:Status or Iptc4xmpExt:Identifier from other software are not
+# taken for ours. Element form and attribute form are both valid XMP.
+IDENTIFIER_ELEMENT = re.compile(rb"<dc:identifier\b[^>/]*>(.*?)</dc:identifier>", re.DOTALL)
+IDENTIFIER_ATTRIBUTE = re.compile(rb"\sdc:identifier\s*=\s*[\"']([^\"']*)[\"']")
+STATUS_ELEMENT = re.compile(rb"<mediapro:Status\b[^>/]*>(.*?)</mediapro:Status>", re.DOTALL)
+STATUS_ATTRIBUTE = re.compile(rb"\smediapro:Status\s*=\s*[\"']([^\"']*)[\"']")
+SUBJECT_ELEMENT = re.compile(rb"<dc:subject\b[^>/]*>(.*?)</dc:subject>", re.DOTALL)
+LIST_ITEM = re.compile(rb"<rdf:li\b[^>/]*>(.*?)</rdf:li>", re.DOTALL)
+TAG = re.compile(rb"<[^>]*>")
+
+# A caption for one language, like XMP:Description-fr
+LANGUAGE_DESCRIPTION = re.compile(r"^XMP(?:-dc)?:Description-([A-Za-z]{2,3}(?:-[A-Za-z0-9]+)*)$")
+
+
+def _element_text(value):
+    """ Return the text of a simple property or the first
+        item of an array property.
+    """
+    items = LIST_ITEM.findall(value)
+
+    if items:
+        value = items[0]
+
+    return TAG.sub(b"", value).strip().decode("utf-8", "replace")
+
+def _find_value(packet, element_regex, attribute_regex):
+    """ Return the single value of a property in the packet, "" if
+        it is absent, or None if it is present more than once with
+        different values.
+    """
+    values = set()
+
+    for value in element_regex.findall(packet):
+        values.add(_element_text(value))
+
+    for value in attribute_regex.findall(packet):
+        values.add(value.strip().decode("utf-8", "replace"))
+
+    values.discard("")
+
+    if len(values) > 1:
+        return None
+
+    return values.pop() if values else ""
+
+def find_xmp_packet(data):
+    """ Return the bytes of the first complete XMP packet in data
+        or None.
+    """
+    start = XMP_START.search(data)
+
+    if not start:
+        return None
+
+    end = XMP_END.search(data, start.end())
+
+    if not end:
+        return None
+
+    return data[start.start():end.end()]
+
+def sniff_xmp(file_path, max_bytes=SNIFF_BYTES):
+    """ Read the tracking fields from a file's XMP packet without
+        starting ExifTool.
+
+        Returns a dict with XMP:Identifier, XMP:Status and HasKeywords
+        or None if the packet could not be found in the first max_bytes
+        or is ambiguous. None means "ask ExifTool".
+    """
+    if os.path.splitext(file_path)[1].lower() not in SNIFF_EXTENSIONS:
+        return None
+
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read(max_bytes)
+
+    except OSError:
+        return None
+
+    packet = find_xmp_packet(data)
+
+    if packet is None:
+        return None
+
+    identifier = _find_value(packet, IDENTIFIER_ELEMENT, IDENTIFIER_ATTRIBUTE)
+    status = _find_value(packet, STATUS_ELEMENT, STATUS_ATTRIBUTE)
+
+    if identifier is None or status is None:
+        return None
+
+    has_keywords = False
+
+    for subject in SUBJECT_ELEMENT.findall(packet):
+        if any(TAG.sub(b"", item).strip() for item in LIST_ITEM.findall(subject)):
+            has_keywords = True
+            break
+
+    return {
+        "XMP:Identifier": identifier or None,
+        "XMP:Status": status or None,
+        "HasKeywords": has_keywords,
+    }
+
+
+NS = {
+    "x": "adobe:ns:meta/",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "mediapro": "http://ns.iview-multimedia.com/mediapro/1.0/",
+    "xml": "http://www.w3.org/XML/1998/namespace",
+}
+
+XPACKET_BEGIN = "<?xpacket begin='\ufeff' id='W5M0MpCehiHzreSzNTczkc9d'?>\n"
+XPACKET_END = "\n<?xpacket end='w'?>\n"
+
+for _prefix, _uri in NS.items():
+    if _prefix != "xml":
+        ET.register_namespace(_prefix, _uri)
+
+
+def _qname(prefix, name):
+    return "{%s}%s" % (NS[prefix], name)
+
+def _register_namespaces(xml_bytes):
+    """ Keep the prefixes used by an existing sidecar so unknown
+        content is written back the way it was found.
+    """
+    for _, (prefix, uri) in ET.iterparse(io.BytesIO(xml_bytes), events=("start-ns",)):
+        try:
+            ET.register_namespace(prefix, uri)
+
+        except ValueError:
+            pass
+
+def _parse_sidecar(xml_bytes):
+    _register_namespaces(xml_bytes)
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    root = ET.fromstring(xml_bytes, parser=parser)
+
+    if root.tag == _qname("rdf", "RDF"):
+        wrapper = ET.Element(_qname("x", "xmpmeta"))
+        wrapper.append(root)
+        root = wrapper
+
+    if root.find(_qname("rdf", "RDF")) is None:
+        raise ValueError("No rdf:RDF element in sidecar")
+
+    return root
+
+def _new_sidecar():
+    root = ET.Element(_qname("x", "xmpmeta"))
+    ET.SubElement(root, _qname("rdf", "RDF"))
+
+    return root
+
+def _remove_property(rdf, name):
+    """ Remove every element or attribute form of a property, given as
+        a qualified name, from all rdf:Description nodes. Properties of
+        the same local name in other namespaces are left alone.
+    """
+    for description in rdf.findall(_qname("rdf", "Description")):
+        for child in description.findall(name):
+            description.remove(child)
+
+        description.attrib.pop(name, None)
+
+def _set_description(rdf, description, text, lang="x-default"):
+    """ Set the item of dc:description for one language, x-default
+        unless lang is given, keeping any other language alternatives
+        already present.
+    """
+    for node in rdf.findall(_qname("rdf", "Description")):
+        existing = node.find(_qname("dc", "description"))
+
+        if existing is not None:
+            alt = existing.find(_qname("rdf", "Alt"))
+
+            if alt is not None:
+                for item in alt.findall(_qname("rdf", "li")):
+                    if item.get(_qname("xml", "lang"), "x-default").lower() == lang.lower():
+                        item.text = text
+
+                        return
+
+                item = ET.Element(_qname("rdf", "li"), {_qname("xml", "lang"): lang})
+                item.text = text
+
+                # x-default goes first, other languages after it
+                if lang == "x-default":
+                    alt.insert(0, item)
+
+                else:
+                    alt.append(item)
+
+                return
+
+            node.remove(existing)
+
+        attribute = _qname("dc", "description")
+
+        if attribute in node.attrib:
+            del node.attrib[attribute]
+
+    prop = ET.SubElement(description, _qname("dc", "description"))
+    alt = ET.SubElement(prop, _qname("rdf", "Alt"))
+    item = ET.SubElement(alt, _qname("rdf", "li"), {_qname("xml", "lang"): lang})
+    item.text = text
+
+def _apply_tags(root, tags):
+    rdf = root.find(_qname("rdf", "RDF"))
+    description = rdf.find(_qname("rdf", "Description"))
+
+    if description is None:
+        description = ET.SubElement(rdf, _qname("rdf", "Description"), {_qname("rdf", "about"): ""})
+
+    keywords = tags.get("MWG:Keywords")
+
+    if keywords is not None:
+        if isinstance(keywords, str):
+            keywords = [keywords]
+
+        _remove_property(rdf, _qname("dc", "subject"))
+        prop = ET.SubElement(description, _qname("dc", "subject"))
+        bag = ET.SubElement(prop, _qname("rdf", "Bag"))
+
+        for keyword in keywords:
+            ET.SubElement(bag, _qname("rdf", "li")).text = str(keyword)
+
+    caption = tags.get("MWG:Description")
+
+    if caption is not None:
+        _set_description(rdf, description, str(caption))
+
+    for key, value in tags.items():
+        match = LANGUAGE_DESCRIPTION.match(key)
+
+        if match and value is not None:
+            _set_description(rdf, description, str(value), match.group(1))
+
+    identifier = tags.get("XMP:Identifier")
+
+    if identifier is not None:
+        _remove_property(rdf, _qname("dc", "identifier"))
+        ET.SubElement(description, _qname("dc", "identifier")).text = str(identifier)
+
+    status = tags.get("XMP:Status")
+
+    if status is not None:
+        _remove_property(rdf, _qname("mediapro", "Status"))
+        ET.SubElement(description, _qname("mediapro", "Status")).text = str(status)
+
+def write_xmp_sidecar(sidecar_path, tags):
+    """ Merge MWG:Keywords, MWG:Description, XMP:Identifier and XMP:Status
+        into an XMP sidecar without ExifTool. Captions in other languages
+        given as XMP:Description-<lang> become xml:lang alternatives.
+
+        Anything else already in the sidecar is kept. Tags with a value
+        of None are left unchanged. The file is written to a temporary
+        file and renamed over the original so readers never see a
+        partial sidecar.
+    """
+    if os.path.exists(sidecar_path):
+        with open(sidecar_path, "rb") as f:
+            root = _parse_sidecar(f.read())
+
+    else:
+        root = _new_sidecar()
+
+    _apply_tags(root, tags)
+    body = ET.tostring(root, encoding="unicode")
+
+    directory = os.path.dirname(os.path.abspath(sidecar_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".llmii-", suffix=".xmp", dir=directory)
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(XPACKET_BEGIN + body + XPACKET_END)
+
+        os.replace(temp_path, sidecar_path)
+
+    except BaseException:
+        try:
+            os.remove(temp_path)
+
+        except OSError:
+            pass
+
+        raise